@@ -4,22 +4,20 @@ Demo front-end for testing the wound detection model.
 """
 
 import os
-import pickle
 import base64
-import io
-import numpy as np
-from flask import Flask, render_template, request, jsonify, Response
+import hashlib
+import json
+import re
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
-from PIL import Image
-from joblib import load as joblib_load
-from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
 from dotenv import load_dotenv
-from chat_handler import chat_with_context
-from wallet_auth import get_wallet_from_request, validate_wallet_address
-import sqlite3
-from datetime import datetime
+from chat_handler import chat_with_context, llm_stats
+from wallet_auth import get_wallet_from_request, is_bot_request, validate_wallet_address
+from sharding import ShardedStore
+from wound_model import WoundClassifier
+from archive import load_archived_conversation, from_env as archiver_from_env
+from chat_writer import ChatTurn, from_env as chat_writer_from_env
+from history_export import export_wallet, import_wallet
 
 # Use absolute paths based on script location
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -29,44 +27,21 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(BASE_DIR), '.env'))
 
 app = Flask(__name__)
 
-# Database for wallet-based chat history
+# Database for wallet-based chat history, optionally sharded by wallet
+# (CHAT_DB_SHARDS); shards are opened and migrated on startup
 DB_PATH = os.path.join(BASE_DIR, 'chat_history.db')
-
-def init_db():
-    """Initialize SQLite database for chat history."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id TEXT PRIMARY KEY,
-            wallet_address TEXT NOT NULL,
-            title TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            conversation_id TEXT NOT NULL,
-            wallet_address TEXT NOT NULL,
-            role TEXT NOT NULL,
-            content TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (conversation_id) REFERENCES conversations(id)
-        )
-    ''')
-    c.execute('''
-        CREATE INDEX IF NOT EXISTS idx_wallet_address ON conversations(wallet_address)
-    ''')
-    c.execute('''
-        CREATE INDEX IF NOT EXISTS idx_messages_wallet ON messages(wallet_address)
-    ''')
-    conn.commit()
-    conn.close()
-
-# Initialize database on startup
-init_db()
+# Chat turns are persisted by a background group-commit writer per shard
+store = ShardedStore(
+    DB_PATH,
+    shard_count=int(os.getenv('CHAT_DB_SHARDS', '1')),
+    pool_size=int(os.getenv('DB_POOL_SIZE', '8')),
+    writer_factory=chat_writer_from_env
+)
+# Idle conversations are moved to compressed cold storage in the background
+for shard in store.shards:
+    archiver = archiver_from_env(shard.db)
+    if archiver is not None:
+        archiver.start()
 # Enable CORS with specific configuration for frontend
 CORS(app, resources={
     r"/predict": {"origins": "*"},
@@ -74,125 +49,90 @@ CORS(app, resources={
     r"/health": {"origins": "*"},
     r"/*": {"origins": "*"}
 }, supports_credentials=True)
-app.config['UPLOAD_FOLDER'] = os.path.join(BASE_DIR, 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
 
-# Create uploads directory if it doesn't exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-# Load model and class names
-MODEL_PATH = os.path.join(BASE_DIR, 'wound_classifier.joblib')
-CLASS_NAMES_PATH = os.path.join(BASE_DIR, 'class_names.pkl')
-IMG_SIZE = (224, 224)  # Keep in sync with training script
-
-model = None
-class_names = None
-feature_extractor = None
+# Wound classifier (MobileNetV2 features + scikit-learn head), shared with the bot
+classifier = WoundClassifier.from_dir(BASE_DIR)
 
-def load_model():
-    """Load the trained scikit-learn classifier and MobileNet backbone."""
-    global model, class_names, feature_extractor
+# Keyset pagination for the history endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
 
-    if not (os.path.exists(MODEL_PATH) and os.path.exists(CLASS_NAMES_PATH)):
-        print("Model files not found. Please train the classifier first.")
-        return False
+def parse_page_args(args):
+    """Read `limit` and `before` query parameters.
 
-    try:
-        print(f"Loading classifier from {MODEL_PATH}...")
-        model = joblib_load(MODEL_PATH)
-
-        with open(CLASS_NAMES_PATH, 'rb') as f:
-            class_names = pickle.load(f)
-
-        feature_extractor = MobileNetV2(
-            input_shape=(*IMG_SIZE, 3),
-            include_top=False,
-            pooling='avg',
-            weights='imagenet'
-        )
-        feature_extractor.trainable = False
-
-        print(f"Classifier loaded. Classes: {class_names}")
-        return True
-    except Exception as e:
-        print(f"Error loading model: {e}")
-        model = None
-        feature_extractor = None
-        return False
+    Returns:
+        (limit, cursor) where cursor is the decoded `before` key or None.
+        Raises ValueError for a malformed cursor or limit.
+    """
+    limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    before = args.get('before')
+    if not before:
+        return limit, None
+    padded = before + '=' * (-len(before) % 4)
+    cursor = json.loads(base64.urlsafe_b64decode(padded).decode('utf-8'))
+    if not isinstance(cursor, list) or len(cursor) != 2:
+        raise ValueError('Invalid cursor')
+    return limit, cursor
+
+def encode_cursor(*key):
+    """Opaque cursor for the sort key of the last row on a page."""
+    raw = json.dumps(list(key), separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def build_search_query(text):
+    """Turn free text into a safe FTS5 query: every word must match, the last as a prefix."""
+    words = re.findall(r'\w+', text.lower())[:16]
+    if not words:
+        return None
+    terms = ['"%s"' % w for w in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def archived_messages_page(archived_rows, limit, cursor):
+    """Apply the message keyset pagination to a decompressed archived conversation."""
+    rows = archived_rows
+    if cursor is not None:
+        rows = [r for r in rows if (r[3], r[0]) < (cursor[0], cursor[1])]
+    page = rows[-limit:]
+    next_cursor = encode_cursor(page[0][3], page[0][0]) if len(rows) > limit else None
+    messages = [{'id': r[0], 'role': r[1], 'content': r[2], 'created_at': r[3]} for r in page]
+    return {'messages': messages, 'next_cursor': next_cursor, 'archived': True}
+
+def read_version(c, table, key_column, key):
+    """Current change counter from wallet_versions / conversation_versions (0 if never written)."""
+    row = c.execute(f'SELECT version FROM {table} WHERE {key_column} = ?', (key,)).fetchone()
+    return row[0] if row else 0
+
+def make_etag(*parts):
+    """Strong ETag for a history response; parts must cover everything the body depends on."""
+    raw = '\x1f'.join(str(p) for p in parts).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+def with_etag(response, etag):
+    """Attach the ETag; no-cache makes clients revalidate on every poll."""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 def allowed_file(filename):
     """Check if file extension is allowed."""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def preprocess_image(image_path=None, image_data=None):
-    """Preprocess image for model prediction.
-    
-    Args:
-        image_path: Path to image file (optional)
-        image_data: PIL Image object or base64 string (optional)
-    """
-    if image_data is not None:
-        if isinstance(image_data, str):
-            # Handle base64 string
-            if image_data.startswith('data:image'):
-                # Remove data URL prefix
-                image_data = image_data.split(',')[1]
-            img_data = base64.b64decode(image_data)
-            img = Image.open(io.BytesIO(img_data))
-        else:
-            # Assume it's a PIL Image
-            img = image_data
-    else:
-        # Load from file path
-        img = Image.open(image_path)
-    
-    img = img.convert('RGB')
-    img = img.resize(IMG_SIZE)
-    img_array = np.array(img, dtype=np.float32)
-    img_array = np.expand_dims(img_array, axis=0)
-    return img_array
-
-def predict_image(image_path=None, image_data=None):
-    """Predict wound type from image.
-    
+def predict_image(image_data):
+    """Predict wound type from an image held in memory.
+
     Args:
-        image_path: Path to image file (optional)
-        image_data: PIL Image object or base64 string (optional)
+        image_data: Raw bytes, base64 string or PIL Image
     """
-    if model is None or feature_extractor is None:
+    if not classifier.loaded:
         return None, "Model not loaded. Please train the model first."
-    
+
     try:
-        # Preprocess image
-        img_array = preprocess_image(image_path=image_path, image_data=image_data)
-        img_array = preprocess_input(img_array.copy())
-        
-        # Extract features
-        features = feature_extractor.predict(img_array, verbose=0)
-        
-        # Scikit-learn prediction
-        predictions = model.predict_proba(features)[0]
-        predicted_class_idx = int(np.argmax(predictions))
-        confidence = float(predictions[predicted_class_idx])
-        predicted_class = class_names[predicted_class_idx]
-        
-        # Get top 3 predictions
-        top_3_indices = np.argsort(predictions)[-3:][::-1]
-        top_3_predictions = [
-            {
-                'class': class_names[idx],
-                'confidence': float(predictions[idx])
-            }
-            for idx in top_3_indices
-        ]
-        
-        return {
-            'predicted_class': predicted_class,
-            'confidence': confidence,
-            'top_3': top_3_predictions
-        }, None
+        return classifier.predict(image_data), None
     except Exception as e:
         return None, str(e)
 
@@ -208,7 +148,7 @@ def predict():
     - multipart/form-data with 'file' field
     - JSON with 'image' field (base64 encoded string)
     """
-    if model is None or feature_extractor is None:
+    if not classifier.loaded:
         return jsonify({'error': 'Model not loaded. Please train the model first.'}), 500
     
     try:
@@ -244,17 +184,8 @@ def predict():
             if not allowed_file(file.filename):
                 return jsonify({'error': 'Invalid file type. Please upload a JPG, PNG, or GIF image.'}), 400
             
-            # Save uploaded file
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            # Make prediction
-            result, error = predict_image(image_path=filepath)
-            
-            # Clean up uploaded file
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            # Decode straight from the upload, no temp file
+            result, error = predict_image(image_data=file.read())
             
             if error:
                 return jsonify({'error': error}), 500
@@ -271,17 +202,19 @@ def predict():
 @app.route('/health')
 def health():
     """Health check endpoint."""
-    model_loaded = model is not None and feature_extractor is not None
+    model_loaded = classifier.loaded
     return jsonify({
         'status': 'healthy',
         'model_loaded': model_loaded,
-        'classes': list(class_names) if class_names is not None else None
+        'classes': list(classifier.class_names) if classifier.class_names is not None else None,
+        'llm': llm_stats(),
+        'chat_writer': store.stats()
     })
 
 @app.route('/chat', methods=['POST'])
 def chat():
     """Handle chat messages from frontend using Gemini AI.
-    Stores messages by wallet address for cross-platform access.
+    Generation only: clients save the turn with POST /chat/messages.
     """
     try:
         data = request.get_json()
@@ -293,47 +226,8 @@ def chat():
             return jsonify({'error': 'No messages provided'}), 400
         
         # Get response from chat handler
-        response_text = chat_with_context(messages)
-        
-        # Store messages if wallet address is provided
-        if wallet_address and validate_wallet_address(wallet_address):
-            import uuid
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            
-            # Create conversation if needed
-            if not conversation_id:
-                conversation_id = str(uuid.uuid4())
-                last_user_message = next((m for m in reversed(messages) if m.get('role') == 'user'), None)
-                title = (last_user_message.get('content', 'New Chat')[:50] if last_user_message else 'New Chat')
-                
-                c.execute('''
-                    INSERT OR REPLACE INTO conversations (id, wallet_address, title, updated_at)
-                    VALUES (?, ?, ?, ?)
-                ''', (conversation_id, wallet_address.lower(), title, datetime.now()))
-            
-            # Save user message
-            last_user_msg = next((m for m in reversed(messages) if m.get('role') == 'user'), None)
-            if last_user_msg:
-                c.execute('''
-                    INSERT INTO messages (conversation_id, wallet_address, role, content)
-                    VALUES (?, ?, ?, ?)
-                ''', (conversation_id, wallet_address.lower(), 'user', last_user_msg.get('content', '')))
-            
-            # Save assistant response
-            c.execute('''
-                INSERT INTO messages (conversation_id, wallet_address, role, content)
-                VALUES (?, ?, ?, ?)
-            ''', (conversation_id, wallet_address.lower(), 'assistant', response_text))
-            
-            # Update conversation timestamp
-            c.execute('''
-                UPDATE conversations SET updated_at = ? WHERE id = ?
-            ''', (datetime.now(), conversation_id))
-            
-            conn.commit()
-            conn.close()
-        
+        response_text = chat_with_context(messages, wallet_address=wallet_address)
+
         return jsonify({
             'choices': [{
                 'delta': {
@@ -347,37 +241,139 @@ def chat():
         return jsonify({'error': str(e)}), 500
 
 
+# Most messages accepted by one /chat/messages call
+MAX_APPEND_MESSAGES = 100
+
+@app.route('/chat/messages', methods=['POST'])
+def append_messages():
+    """Append messages to a wallet's conversation without calling the LLM.
+
+    Body:
+        conversation_id: Conversation to append to (created if new)
+        messages: List of {role: 'user'|'assistant', content}
+        title: Optional title for a new conversation (default: first message)
+
+    All messages are written in one transaction by the background writer.
+    """
+    data = request.get_json(silent=True) or {}
+    wallet_address = get_wallet_from_request(request) or data.get('wallet_address')
+    conversation_id = data.get('conversation_id')
+    messages = data.get('messages')
+
+    if not wallet_address or not validate_wallet_address(wallet_address):
+        return jsonify({'error': 'Valid wallet address required'}), 400
+
+    if not conversation_id or not isinstance(conversation_id, str):
+        return jsonify({'error': 'conversation_id required'}), 400
+
+    if not isinstance(messages, list) or not 0 < len(messages) <= MAX_APPEND_MESSAGES:
+        return jsonify({'error': f'Between 1 and {MAX_APPEND_MESSAGES} messages required'}), 400
+
+    turn_messages = []
+    for message in messages:
+        if (not isinstance(message, dict) or message.get('role') not in ('user', 'assistant')
+                or not isinstance(message.get('content'), str) or not message['content']):
+            return jsonify({'error': 'Each message needs a role (user or assistant) and content'}), 400
+        turn_messages.append((message['role'], message['content']))
+
+    title = data.get('title')
+    if title is not None and not isinstance(title, str):
+        return jsonify({'error': 'Invalid title'}), 400
+
+    try:
+        writer = store.writer_for(wallet_address)
+        # Make this wallet's queued turns visible before the ownership check
+        writer.barrier(wallet_address)
+
+        with store.db_for(wallet_address).connection() as conn:
+            owner = conn.execute('''
+                SELECT wallet_address FROM conversations WHERE id = ?
+                UNION ALL
+                SELECT wallet_address FROM archived_conversations WHERE id = ?
+            ''', (conversation_id, conversation_id)).fetchone()
+
+        if owner and owner[0].lower() != wallet_address.lower():
+            return jsonify({'error': 'Conversation not found'}), 404
+
+        # Queued for the background writer. With CHAT_WRITE_DURABILITY=commit this
+        # waits for the commit and raises if the turn was dropped (answered as 500)
+        writer.enqueue(ChatTurn(conversation_id, wallet_address, turn_messages,
+                                title=title[:50] if title else None))
+
+        return jsonify({'success': True, 'conversation_id': conversation_id, 'appended': len(turn_messages)})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/chat/history', methods=['GET'])
 def get_chat_history():
-    """Get chat history for a wallet address."""
+    """Get chat history for a wallet address, newest first.
+
+    Supports conditional GET: send the returned ETag as If-None-Match to get
+    304 Not Modified until the wallet's history changes.
+
+    Query parameters:
+        limit: Page size (default 50, max 200)
+        before: `next_cursor` from the previous page
+    """
     wallet_address = get_wallet_from_request(request) or request.args.get('wallet_address')
     
     if not wallet_address or not validate_wallet_address(wallet_address):
         return jsonify({'error': 'Valid wallet address required'}), 400
+
+    try:
+        limit, cursor = parse_page_args(request.args)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # Get conversations
-        c.execute('''
-            SELECT id, title, created_at, updated_at
-            FROM conversations
-            WHERE wallet_address = ?
-            ORDER BY updated_at DESC
-        ''', (wallet_address.lower(),))
-        
+        # Make this wallet's queued chat turns visible first
+        store.writer_for(wallet_address).barrier(wallet_address)
+
+        with store.db_for(wallet_address).connection() as conn:
+            c = conn.cursor()
+
+            # Read the version before the data so the ETag is never newer than the body
+            version = read_version(c, 'wallet_versions', 'wallet_address', wallet_address.lower())
+            etag = make_etag('history', wallet_address.lower(), version, request.query_string)
+            if request.if_none_match.contains(etag):
+                return with_etag(Response(status=304), etag)
+
+            # Get conversations from the hot table and the archive, each walking
+            # its (wallet_address, updated_at, id) index backwards, then merge.
+            # Counts and previews are stored on the rows, so messages is not read.
+            keyset = 'AND (updated_at, id) < (?, ?)' if cursor is not None else ''
+            params = (wallet_address.lower(),) + tuple(cursor or ()) + (limit,)
+            rows = []
+            for table, archived in (('conversations', False), ('archived_conversations', True)):
+                c.execute(f'''
+                    SELECT id, title, created_at, updated_at, message_count, last_message_preview, last_role
+                    FROM {table}
+                    WHERE wallet_address = ? {keyset}
+                    ORDER BY updated_at DESC, id DESC
+                    LIMIT ?
+                ''', params)
+                rows.extend(row + (archived,) for row in c.fetchall())
+
+        rows.sort(key=lambda row: (row[3], row[0]), reverse=True)
+        rows = rows[:limit]
+
         conversations = []
-        for row in c.fetchall():
+        for row in rows:
             conversations.append({
                 'id': row[0],
                 'title': row[1],
                 'created_at': row[2],
-                'updated_at': row[3]
+                'updated_at': row[3],
+                'message_count': row[4],
+                'last_message_preview': row[5],
+                'last_role': row[6],
+                'archived': row[7]
             })
-        
-        conn.close()
-        return jsonify({'conversations': conversations})
+
+        next_cursor = encode_cursor(rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+        return with_etag(jsonify({'conversations': conversations, 'next_cursor': next_cursor}), etag)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -385,84 +381,229 @@ def get_chat_history():
 
 @app.route('/chat/conversation/<conversation_id>', methods=['GET'])
 def get_conversation(conversation_id):
-    """Get messages for a specific conversation."""
+    """Get messages for a specific conversation.
+
+    Returns the most recent page in chronological order. To load older
+    messages, pass the returned `next_cursor` as `before`. Supports
+    If-None-Match like /chat/history, keyed on the conversation.
+
+    Query parameters:
+        limit: Page size (default 50, max 200)
+        before: `next_cursor` from the previous page
+    """
     wallet_address = get_wallet_from_request(request) or request.args.get('wallet_address')
     
     if not wallet_address or not validate_wallet_address(wallet_address):
         return jsonify({'error': 'Valid wallet address required'}), 400
+
+    try:
+        limit, cursor = parse_page_args(request.args)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid limit or cursor'}), 400
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # Verify conversation belongs to wallet
-        c.execute('''
-            SELECT wallet_address FROM conversations WHERE id = ?
-        ''', (conversation_id,))
-        result = c.fetchone()
-        
-        if not result or result[0].lower() != wallet_address.lower():
-            conn.close()
-            return jsonify({'error': 'Conversation not found'}), 404
-        
-        # Get messages
-        c.execute('''
-            SELECT role, content, created_at
-            FROM messages
-            WHERE conversation_id = ? AND wallet_address = ?
-            ORDER BY created_at ASC
-        ''', (conversation_id, wallet_address.lower()))
-        
+        # Make this wallet's queued chat turns visible first
+        store.writer_for(wallet_address).barrier(wallet_address)
+
+        with store.db_for(wallet_address).connection() as conn:
+            c = conn.cursor()
+
+            # Answer unchanged polls from the version counter alone
+            version = read_version(c, 'conversation_versions', 'conversation_id', conversation_id)
+            etag = make_etag('conversation', wallet_address.lower(), conversation_id, version, request.query_string)
+            if request.if_none_match.contains(etag):
+                return with_etag(Response(status=304), etag)
+
+            # Verify conversation belongs to wallet
+            c.execute('''
+                SELECT wallet_address FROM conversations WHERE id = ?
+            ''', (conversation_id,))
+            result = c.fetchone()
+
+            if not result:
+                # Old conversations live compressed in the archive
+                archived = load_archived_conversation(c, conversation_id)
+                if archived and archived[0].lower() == wallet_address.lower():
+                    return with_etag(jsonify(archived_messages_page(archived[1], limit, cursor)), etag)
+
+            if not result or result[0].lower() != wallet_address.lower():
+                return jsonify({'error': 'Conversation not found'}), 404
+
+            # Get messages newest first (walks idx_messages_conversation_created backwards)
+            if cursor is None:
+                c.execute('''
+                    SELECT id, role, content, created_at
+                    FROM messages
+                    WHERE conversation_id = ? AND wallet_address = ?
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT ?
+                ''', (conversation_id, wallet_address.lower(), limit))
+            else:
+                c.execute('''
+                    SELECT id, role, content, created_at
+                    FROM messages
+                    WHERE conversation_id = ? AND wallet_address = ? AND (created_at, id) < (?, ?)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT ?
+                ''', (conversation_id, wallet_address.lower(), cursor[0], cursor[1], limit))
+            rows = c.fetchall()
+
+        next_cursor = encode_cursor(rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+
         messages = []
-        for row in c.fetchall():
+        for row in reversed(rows):
             messages.append({
-                'role': row[0],
-                'content': row[1],
-                'created_at': row[2]
+                'id': row[0],
+                'role': row[1],
+                'content': row[2],
+                'created_at': row[3]
             })
         
-        conn.close()
-        return jsonify({'messages': messages})
+        return with_etag(jsonify({'messages': messages, 'next_cursor': next_cursor}), etag)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/chat/search', methods=['GET'])
+def search_chat_history():
+    """Full-text search over a wallet's chat messages.
+
+    Query parameters:
+        q: Search text
+        limit: Page size (default 20, max 200)
+        offset: `next_offset` from the previous page
+    """
+    wallet_address = get_wallet_from_request(request) or request.args.get('wallet_address')
+
+    if not wallet_address or not validate_wallet_address(wallet_address):
+        return jsonify({'error': 'Valid wallet address required'}), 400
+
+    match = build_search_query(request.args.get('q', ''))
+    if not match:
+        return jsonify({'error': 'Search text required'}), 400
+
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), MAX_PAGE_SIZE))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or offset'}), 400
+
+    try:
+        # Make this wallet's queued chat turns visible first
+        store.writer_for(wallet_address).barrier(wallet_address)
+
+        with store.db_for(wallet_address).connection() as conn:
+            c = conn.cursor()
+
+            # Scope to the wallet inside FTS so only its doclist is intersected
+            c.execute('''
+                SELECT m.id, m.conversation_id, conv.title, m.role, m.created_at,
+                       snippet(messages_fts, 0, '<mark>', '</mark>', '…', 12),
+                       bm25(messages_fts, 1.0, 0.0) AS score
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                LEFT JOIN conversations conv ON conv.id = m.conversation_id
+                WHERE messages_fts MATCH ?
+                ORDER BY score
+                LIMIT ? OFFSET ?
+            ''', ('wallet_address : "%s" AND content : (%s)' % (wallet_address.lower(), match), limit, offset))
+            rows = c.fetchall()
+
+        results = []
+        for row in rows:
+            results.append({
+                'message_id': row[0],
+                'conversation_id': row[1],
+                'conversation_title': row[2],
+                'role': row[3],
+                'created_at': row[4],
+                'snippet': row[5],
+                'score': row[6]
+            })
+
+        next_offset = offset + limit if len(rows) == limit else None
+        return jsonify({'results': results, 'next_offset': next_offset})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/chat/export', methods=['GET'])
+def export_chat_history():
+    """Download a wallet's full chat history as NDJSON (streamed)."""
+    wallet_address = get_wallet_from_request(request) or request.args.get('wallet_address')
+
+    if not wallet_address or not validate_wallet_address(wallet_address):
+        return jsonify({'error': 'Valid wallet address required'}), 400
+
+    # Make this wallet's queued chat turns visible first
+    store.writer_for(wallet_address).barrier(wallet_address)
+
+    lines = export_wallet(store.db_for(wallet_address), wallet_address)
+    return Response(
+        stream_with_context(lines),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="chat-history-{wallet_address.lower()}.ndjson"'}
+    )
+
+
+@app.route('/chat/import', methods=['POST'])
+def import_chat_history():
+    """Import an NDJSON export (request body) into a wallet's chat history."""
+    wallet_address = get_wallet_from_request(request) or request.args.get('wallet_address')
+
+    if not wallet_address or not validate_wallet_address(wallet_address):
+        return jsonify({'error': 'Valid wallet address required'}), 400
+
+    try:
+        # Read the body line by line instead of buffering it
+        counts = import_wallet(store.db_for(wallet_address), wallet_address, request.stream)
+        return jsonify({'success': True, **counts})
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/wallet/link-telegram', methods=['POST'])
 def link_telegram_wallet():
-    """Link a Telegram user ID to a wallet address."""
+    """Link a Telegram user ID to a wallet address.
+
+    The web app proves wallet ownership with a signature; the Telegram bot,
+    which cannot sign for the user, sends BOT_API_SECRET instead.
+    """
     data = request.get_json()
     telegram_user_id = data.get('telegram_user_id')
     wallet_address = data.get('wallet_address')
     signature = data.get('signature')  # Signature proving wallet ownership
     
-    if not all([telegram_user_id, wallet_address, signature]):
+    if not all([telegram_user_id, wallet_address]):
         return jsonify({'error': 'Missing required fields'}), 400
+
+    if not signature and not is_bot_request(request):
+        return jsonify({'error': 'Signature or bot credential required'}), 401
     
     if not validate_wallet_address(wallet_address):
         return jsonify({'error': 'Invalid wallet address'}), 400
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # Create wallet-telegram link table if needed
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS wallet_telegram_links (
-                telegram_user_id TEXT PRIMARY KEY,
-                wallet_address TEXT NOT NULL,
-                linked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Store the link
-        c.execute('''
-            INSERT OR REPLACE INTO wallet_telegram_links (telegram_user_id, wallet_address)
-            VALUES (?, ?)
-        ''', (str(telegram_user_id), wallet_address.lower()))
-        
-        conn.commit()
-        conn.close()
+        # A Telegram user may relink to a wallet that lives in another shard
+        for shard in store.shards:
+            if shard is not store.shard_for(wallet_address):
+                with shard.db.connection() as conn:
+                    conn.execute('DELETE FROM wallet_telegram_links WHERE telegram_user_id = ?',
+                                 (str(telegram_user_id),))
+
+        with store.db_for(wallet_address).connection() as conn:
+            c = conn.cursor()
+
+            # Store the link
+            c.execute('''
+                INSERT OR REPLACE INTO wallet_telegram_links (telegram_user_id, wallet_address)
+                VALUES (?, ?)
+            ''', (str(telegram_user_id), wallet_address.lower()))
         
         return jsonify({'success': True, 'message': 'Wallet linked successfully'})
     
@@ -472,8 +613,16 @@ def link_telegram_wallet():
 
 if __name__ == '__main__':
     # Load model on startup
-    load_model()
+    classifier.load()
     
+    # Turn SIGTERM into a normal exit so queued chat writes are drained
+    import signal
+    import sys
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     # Run the app
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    try:
+        app.run(debug=True, host='0.0.0.0', port=5001)
+    finally:
+        store.close()
 
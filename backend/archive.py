@@ -0,0 +1,190 @@
+"""
+Compressed cold-storage archival for old conversations.
+
+A background job moves conversations that have not been updated for
+ARCHIVE_AFTER_DAYS out of the hot conversations/messages tables (and their
+indexes and FTS entries) into archived_conversations, one row per
+conversation with all messages batch-compressed into a single zlib blob.
+Freed pages are returned to the OS with incremental vacuum.
+
+Reads decompress archived conversations on demand; writing to an archived
+conversation restores it to the hot tables first. Archived messages are not
+in the /chat/search index.
+
+Settings (environment variables, all optional):
+    ARCHIVE_AFTER_DAYS    idle days before a conversation is archived (default 90, 0 disables)
+    ARCHIVE_INTERVAL_S    seconds between archival runs (default 3600)
+    ARCHIVE_BATCH         conversations moved per transaction (default 200)
+    ARCHIVE_VACUUM_PAGES  pages released per incremental vacuum (default 2000)
+"""
+
+import json
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+# PRAGMA auto_vacuum value for INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def compress_messages(rows) -> bytes:
+    """Pack (id, role, content, created_at) rows into one compressed blob."""
+    payload = json.dumps([list(row) for row in rows], separators=(',', ':'), default=str)
+    return zlib.compress(payload.encode('utf-8'), 9)
+
+
+def decompress_messages(blob: bytes):
+    """Inverse of compress_messages: list of [id, role, content, created_at]."""
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+def load_archived_conversation(c, conversation_id):
+    """
+    Fetch an archived conversation.
+
+    Returns:
+        (wallet_address, messages) or None if it is not archived
+    """
+    row = c.execute('''
+        SELECT wallet_address, messages_blob FROM archived_conversations WHERE id = ?
+    ''', (conversation_id,)).fetchone()
+    if row is None:
+        return None
+    return row[0], decompress_messages(row[1])
+
+
+def restore_conversation(c, conversation_id, wallet_address) -> bool:
+    """
+    Move an archived conversation back into the hot tables (inside the caller's transaction).
+
+    Only a conversation archived for wallet_address is restored; another
+    wallet's conversation with the same id is left alone.
+    """
+    row = c.execute('''
+        SELECT wallet_address, title, created_at, updated_at, messages_blob
+        FROM archived_conversations WHERE id = ? AND wallet_address = lower(?)
+    ''', (conversation_id, wallet_address)).fetchone()
+    if row is None:
+        return False
+
+    wallet_address, title, created_at, updated_at, blob = row
+    # message_count and the preview are rebuilt by the messages triggers
+    c.execute('''
+        INSERT OR REPLACE INTO conversations (id, wallet_address, title, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (conversation_id, wallet_address, title, created_at, updated_at))
+    # Messages get fresh ids: archived ids may clash with rows copied in by
+    # reshard.py from another shard. The blob is already in (created_at, id) order.
+    c.executemany('''
+        INSERT INTO messages (conversation_id, wallet_address, role, content, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(conversation_id, wallet_address, m[1], m[2], m[3]) for m in decompress_messages(blob)])
+    c.execute('DELETE FROM archived_conversations WHERE id = ?', (conversation_id,))
+    return True
+
+
+class Archiver:
+    """Periodic job that archives idle conversations and vacuums the hot tables."""
+
+    def __init__(self, db, after_days=90, interval=3600.0, batch_size=200, vacuum_pages=2000):
+        self.db = db
+        self.after_days = after_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.archived_total = 0
+        self._stop = threading.Event()
+
+    def ensure_incremental_vacuum(self) -> None:
+        """Switch the database to incremental auto-vacuum (one full VACUUM, first run only)."""
+        with self.db.connection() as conn:
+            mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+            if mode == AUTO_VACUUM_INCREMENTAL:
+                return
+            conn.execute(f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}')
+            # Changing auto_vacuum on an existing file only takes effect after
+            # VACUUM, which cannot run inside a transaction
+            conn.commit()
+            conn.execute('VACUUM')
+
+    def archive_batch(self, cutoff) -> int:
+        """Archive up to batch_size conversations last updated before cutoff."""
+        with self.db.connection() as conn:
+            c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE')
+            conversations = c.execute('''
+                SELECT id, wallet_address, title, created_at, updated_at, last_message_preview, last_role
+                FROM conversations
+                WHERE updated_at < ?
+                LIMIT ?
+            ''', (cutoff, self.batch_size)).fetchall()
+
+            for conversation_id, wallet_address, title, created_at, updated_at, preview, last_role in conversations:
+                rows = c.execute('''
+                    SELECT id, role, content, created_at
+                    FROM messages
+                    WHERE conversation_id = ?
+                    ORDER BY created_at, id
+                ''', (conversation_id,)).fetchall()
+                c.execute('''
+                    INSERT OR REPLACE INTO archived_conversations
+                        (id, wallet_address, title, created_at, updated_at, message_count, messages_blob,
+                         last_message_preview, last_role)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (conversation_id, wallet_address, title, created_at, updated_at,
+                      len(rows), compress_messages(rows), preview, last_role))
+                c.execute('DELETE FROM messages WHERE conversation_id = ?', (conversation_id,))
+                c.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,))
+
+        self.archived_total += len(conversations)
+        return len(conversations)
+
+    def run_once(self) -> int:
+        """Archive everything past the cutoff, then release free pages."""
+        cutoff = datetime.now() - timedelta(days=self.after_days)
+        archived = 0
+        while not self._stop.is_set():
+            moved = self.archive_batch(cutoff)
+            archived += moved
+            if moved < self.batch_size:
+                break
+
+        with self.db.connection() as conn:
+            conn.execute(f'PRAGMA incremental_vacuum({int(self.vacuum_pages)})').fetchall()
+        return archived
+
+    def _loop(self):
+        try:
+            self.ensure_incremental_vacuum()
+        except Exception as e:
+            print(f"Archiver: could not enable incremental vacuum: {e}")
+
+        while not self._stop.is_set():
+            try:
+                archived = self.run_once()
+                if archived:
+                    print(f"Archiver: archived {archived} conversations")
+            except Exception as e:
+                print(f"Archiver: run failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        threading.Thread(target=self._loop, name="archiver", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def from_env(db):
+    """Build an Archiver from environment variables, or None if archival is disabled."""
+    after_days = float(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+    if after_days <= 0:
+        return None
+    return Archiver(
+        db,
+        after_days=after_days,
+        interval=float(os.getenv('ARCHIVE_INTERVAL_S', '3600')),
+        batch_size=int(os.getenv('ARCHIVE_BATCH', '200')),
+        vacuum_pages=int(os.getenv('ARCHIVE_VACUUM_PAGES', '2000')),
+    )
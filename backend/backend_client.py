@@ -0,0 +1,118 @@
+"""
+Shared HTTP client for the bot's calls to the Flask backend.
+
+One requests.Session with a keep-alive connection pool is reused for every
+call, so repeated calls do not open a new TCP connection each time. Every
+call has a connect and a read timeout. Failed connections are retried once;
+HTTP errors are not. post_async() runs the call on the client's own small
+worker pool and returns a Future, so a handler can acknowledge the user at
+once and confirm when the backend replies. Every call carries the bot's
+BOT_API_SECRET, which the backend accepts in place of a wallet signature.
+
+Settings (environment variables, all optional):
+    BACKEND_URL              backend base URL (default http://localhost:5001)
+    BACKEND_TIMEOUT_S        read timeout per call (default 5)
+    BACKEND_CONNECT_TIMEOUT_S  connect timeout per call (default 2)
+    BACKEND_WORKERS          concurrent background calls and pooled connections (default 4)
+    BOT_API_SECRET           secret shared with the backend; needed to link wallets
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from wallet_auth import BOT_SECRET_HEADER
+
+
+class BackendError(Exception):
+    """Raised when the backend cannot be reached or answers with an error status."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class BackendClient:
+    """Pooled, timed-out JSON calls to the backend, sync or in the background."""
+
+    def __init__(self, base_url, timeout=5.0, connect_timeout=2.0, workers=4, bot_secret=""):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, timeout)
+        self.session = requests.Session()
+        if bot_secret:
+            self.session.headers[BOT_SECRET_HEADER] = bot_secret
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=workers,
+            # Reconnect once if the pooled connection was closed by the server
+            max_retries=Retry(total=1, connect=1, read=0, status=0, redirect=0),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backend")
+        self.calls = 0
+        self.failures = 0
+
+    def post(self, path, payload) -> dict:
+        """
+        POST JSON to the backend.
+
+        Returns:
+            dict: Decoded JSON response (empty if the body is not JSON)
+
+        Raises:
+            BackendError: On connection errors, timeouts and non-2xx answers
+        """
+        self.calls += 1
+        try:
+            resp = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            self.failures += 1
+            raise BackendError(f"POST {path} failed: {e}") from e
+        if not resp.ok:
+            self.failures += 1
+            raise BackendError(f"POST {path} returned {resp.status_code}", status=resp.status_code)
+        try:
+            return resp.json()
+        except ValueError:
+            return {}
+
+    def post_async(self, path, payload):
+        """post() on a background thread; returns a Future with its result."""
+        return self._executor.submit(self.post, path, payload)
+
+    def link_telegram(self, telegram_user_id, wallet_address):
+        """
+        Link a Telegram user to a wallet in the background; returns a Future.
+
+        Authenticated by the bot secret, so it fails with status 401 when
+        BOT_API_SECRET is not set on both sides.
+        """
+        return self.post_async("/wallet/link-telegram", {
+            "telegram_user_id": str(telegram_user_id),
+            "wallet_address": wallet_address,
+        })
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "failures": self.failures}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+def from_env() -> BackendClient:
+    """Build the bot's BackendClient from environment variables."""
+    bot_secret = os.getenv("BOT_API_SECRET", "")
+    if not bot_secret:
+        print("Warning: BOT_API_SECRET is not set; /linkwallet will be rejected by the backend")
+    return BackendClient(
+        os.getenv("BACKEND_URL", "http://localhost:5001"),
+        timeout=float(os.getenv("BACKEND_TIMEOUT_S", "5")),
+        connect_timeout=float(os.getenv("BACKEND_CONNECT_TIMEOUT_S", "2")),
+        workers=int(os.getenv("BACKEND_WORKERS", "4")),
+        bot_secret=bot_secret,
+    )
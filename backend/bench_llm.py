@@ -0,0 +1,97 @@
+"""
+Throughput and tail-latency benchmark for the chat request path.
+
+Runs concurrent chat requests either in-process through chat_with_context()
+or over HTTP against a running backend (/chat). Pair it with LLM_BACKEND=fake
+to benchmark on an isolated machine without network access or API quota.
+
+Usage:
+    LLM_BACKEND=fake FAKE_LLM_LATENCY=lognormal:800:0.5 python3 bench_llm.py
+    python3 bench_llm.py --requests 500 --concurrency 32
+    python3 bench_llm.py --url http://localhost:5001
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_MESSAGES = [
+    "I have a headache and feel dizzy",
+    "My sore throat has lasted three days",
+    "I have a fever and chills since yesterday",
+    "Is a runny nose with green discharge a problem?",
+]
+
+
+def percentile(sorted_values, pct):
+    """Return the pct-th percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def make_inprocess_call():
+    from chat_handler import chat_with_context
+
+    def call(i):
+        text = SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)]
+        chat_with_context([{"role": "user", "content": text}])
+    return call
+
+
+def make_http_call(url):
+    import requests
+
+    session = requests.Session()
+
+    def call(i):
+        text = SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)]
+        resp = session.post(f"{url}/chat", json={"messages": [{"role": "user", "content": text}]}, timeout=60)
+        resp.raise_for_status()
+    return call
+
+
+def run(call, total, concurrency):
+    latencies = []
+    errors = 0
+
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            call(i)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for elapsed, error in pool.map(timed, range(total)):
+            latencies.append(elapsed)
+            if error is not None:
+                errors += 1
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    print(f"Requests:    {total} (concurrency {concurrency})")
+    print(f"Errors:      {errors}")
+    print(f"Wall time:   {wall:.2f}s")
+    print(f"Throughput:  {total / wall:.1f} req/s")
+    for pct in (50, 90, 99, 99.9):
+        print(f"p{pct:<5}      {percentile(latencies, pct) * 1000:.1f} ms")
+    print(f"max         {latencies[-1] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chat request path")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--url", help="Benchmark a running backend over HTTP instead of in-process")
+    args = parser.parse_args()
+
+    call = make_http_call(args.url.rstrip("/")) if args.url else make_inprocess_call()
+    run(call, args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Concurrent read/write benchmark for the chat history database.
+
+Compares the old access pattern (a fresh sqlite3.connect per request in the
+default rollback-journal mode) with the pooled WAL storage layer, using the
+same statements the /chat and /chat/history handlers run.
+
+Usage:
+    python3 bench_storage.py
+    python3 bench_storage.py --writers 8 --readers 16 --seconds 10
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from storage import Database
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS conversations (
+        id TEXT PRIMARY KEY, wallet_address TEXT NOT NULL, title TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL,
+        wallet_address TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    'CREATE INDEX IF NOT EXISTS idx_wallet_address ON conversations(wallet_address)',
+    'CREATE INDEX IF NOT EXISTS idx_messages_wallet ON messages(wallet_address)',
+]
+
+WALLETS = [f"0x{i:040x}" for i in range(64)]
+
+
+class PerRequestConnections:
+    """The old pattern: connect per request, default journal, no pooling."""
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def write_chat(db, wallet):
+    with db.connection() as conn:
+        c = conn.cursor()
+        conversation_id = str(uuid.uuid4())
+        c.execute('INSERT OR REPLACE INTO conversations (id, wallet_address, title, updated_at) VALUES (?, ?, ?, ?)',
+                  (conversation_id, wallet, 'Benchmark', datetime.now()))
+        c.execute('INSERT INTO messages (conversation_id, wallet_address, role, content) VALUES (?, ?, ?, ?)',
+                  (conversation_id, wallet, 'user', 'I have a headache'))
+        c.execute('INSERT INTO messages (conversation_id, wallet_address, role, content) VALUES (?, ?, ?, ?)',
+                  (conversation_id, wallet, 'assistant', 'Rest and drink water. This is not medical advice.'))
+        c.execute('UPDATE conversations SET updated_at = ? WHERE id = ?', (datetime.now(), conversation_id))
+
+
+def read_history(db, wallet):
+    with db.connection() as conn:
+        conn.execute('SELECT id, title, created_at, updated_at FROM conversations '
+                     'WHERE wallet_address = ? ORDER BY updated_at DESC', (wallet,)).fetchall()
+
+
+def run(label, db, writers, readers, seconds):
+    counts = {"writes": 0, "reads": 0, "locked": 0, "errors": 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def worker(op, key, index):
+        n = 0
+        while time.monotonic() < stop:
+            try:
+                op(db, WALLETS[(index + n) % len(WALLETS)])
+                with lock:
+                    counts[key] += 1
+            except sqlite3.OperationalError as e:
+                with lock:
+                    counts["locked" if "locked" in str(e) else "errors"] += 1
+            n += 1
+
+    threads = [threading.Thread(target=worker, args=(write_chat, "writes", i)) for i in range(writers)]
+    threads += [threading.Thread(target=worker, args=(read_history, "reads", i)) for i in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    print(f"{label:<22} writes/s {counts['writes'] / seconds:>9.1f}   reads/s {counts['reads'] / seconds:>9.1f}   "
+          f"'database is locked' {counts['locked']:>5}   other errors {counts['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat history storage")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, make in (
+            ("per-request connect", PerRequestConnections),
+            ("pooled WAL", lambda p: Database(p, pool_size=args.writers + args.readers)),
+        ):
+            path = os.path.join(tmp, f"{label.replace(' ', '_')}.db")
+            conn = sqlite3.connect(path)
+            for stmt in SCHEMA:
+                conn.execute(stmt)
+            conn.commit()
+            conn.close()
+
+            db = make(path)
+            run(label, db, args.writers, args.readers, args.seconds)
+            if hasattr(db, "close_all"):
+                db.close_all()
+
+
+if __name__ == "__main__":
+    main()
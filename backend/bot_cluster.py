@@ -0,0 +1,259 @@
+"""
+Multi-process deployment of the Telegram bot, partitioned by chat_id.
+
+One ingest process receives updates (long polling, or the webhook receiver
+when BOT_WEBHOOK_URL is set) and puts each one on the local queue of one of
+BOT_PROCESSES worker processes, picked by a hash of the update's chat_id.
+Each worker imports script.py, so it runs the same handlers, and processes
+its updates on its own per-chat ordered pool (see update_dispatcher.py). A
+chat always lands on the same worker, so its updates keep their order and
+its session is only touched by that one process, while handler work is
+spread across cores.
+
+Session state is partitioned by ownership rather than by file: all workers
+share bot_sessions.db (WAL mode), and each reads and writes only the chats
+routed to it. Changing the worker count moves no data. The ingest process
+pauses dispatching, lets every worker finish its queued updates and flush
+its sessions, then starts the new set of workers. Each chat's new owner
+loads its session from disk on the chat's next update. With BOT_SESSION_DB
+disabled, chats that change owner start a fresh session.
+
+Send SIGUSR1 / SIGUSR2 to the ingest process to add or remove a worker, or
+restart it with a different BOT_PROCESSES. A worker that dies (crash,
+SIGKILL) is restarted on a fresh queue when its next update arrives; the
+updates that were queued for it are logged and lost, since it may have died
+holding the queue's lock. Workers ignore SIGINT and SIGTERM: stopping the
+ingest process (alone or with its whole process group) makes every worker
+finish its queue and persist its state before exiting.
+
+Limits that Telegram and the LLM provider apply to the whole bot
+(TG_GLOBAL_RATE, LLM_RATE_PER_MIN, LLM_RATE_BURST) are split evenly
+between the workers.
+
+Settings (environment variables, all optional):
+    BOT_PROCESSES   worker processes (default: number of CPUs)
+    BOT_QUEUE_SIZE  updates queued per worker before ingest waits (default 1000)
+
+Run:
+    python3 bot_cluster.py
+"""
+
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import zlib
+
+import telebot
+from dotenv import load_dotenv
+
+from bot_webhook import from_env as webhook_from_env
+from update_dispatcher import update_chat_id
+
+# Whole-bot budgets divided between workers: (variable, default when unset)
+SHARED_BUDGETS = (
+    ("TG_GLOBAL_RATE", "25"),
+    ("LLM_RATE_PER_MIN", "0"),
+    ("LLM_RATE_BURST", ""),
+)
+
+
+def worker_index(chat_id, worker_count: int) -> int:
+    """Stable chat -> worker mapping; updates without a chat go to worker 0."""
+    if worker_count <= 1 or chat_id is None:
+        return 0
+    return zlib.crc32(str(chat_id).encode('utf-8')) % worker_count
+
+
+def split_budgets(worker_count: int) -> None:
+    """Give this worker its share of the bot-wide rate limits."""
+    for name, default in SHARED_BUDGETS:
+        value = os.getenv(name, default)
+        if value:
+            os.environ[name] = str(max(float(value) / worker_count, 0.0))
+
+
+def run_worker(index: int, worker_count: int, updates) -> None:
+    """Worker process: run script.py's handlers on the updates routed here."""
+    # Ctrl+C and a process-group SIGTERM (e.g. systemd stop) reach every
+    # worker too; ignore them so the ingest process can drain us in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    split_budgets(worker_count)
+
+    import script  # builds the bot and registers its handlers
+
+    print(f"Bot worker {index + 1}/{worker_count} ready (pid {os.getpid()})")
+    while True:
+        update = updates.get()
+        if update is None:
+            break
+        try:
+            script.bot.process_new_updates([update])
+        except Exception as e:
+            print(f"Bot worker {index + 1}: could not dispatch update {update.update_id}: {e}")
+    # Drain handlers and replies, persist sessions before the chats move
+    script.shutdown()
+
+
+class BotCluster:
+    """Worker processes with one update queue each, routed by chat_id."""
+
+    def __init__(self, worker_count: int, queue_size: int = 1000):
+        self.queue_size = queue_size
+        self._ctx = multiprocessing.get_context("spawn")
+        # Held while dispatching and while re-partitioning
+        self._lock = threading.Lock()
+        self._workers = []
+        self.dispatched = 0
+        self.restarts = 0
+        self._start(max(1, worker_count))
+
+    @property
+    def worker_count(self) -> int:
+        return len(self._workers)
+
+    def _spawn(self, index, worker_count, updates):
+        process = self._ctx.Process(
+            target=run_worker,
+            args=(index, worker_count, updates),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        return process
+
+    def _start(self, worker_count):
+        workers = []
+        for index in range(worker_count):
+            updates = self._ctx.Queue(maxsize=self.queue_size)
+            workers.append([self._spawn(index, worker_count, updates), updates])
+        self._workers = workers
+
+    @staticmethod
+    def _lost(process, updates) -> int:
+        """Updates left in a dead worker's queue (it may have died holding the queue's lock)."""
+        try:
+            lost = updates.qsize()
+        except NotImplementedError:
+            lost = -1
+        print(f"Bot worker {process.name} exited with code {process.exitcode}; "
+              f"{lost if lost >= 0 else 'unknown number of'} queued updates lost")
+        return max(lost, 0)
+
+    def _ensure_alive(self, index):
+        worker = self._workers[index]
+        if not worker[0].is_alive():
+            self._lost(*worker)
+            worker[1] = self._ctx.Queue(maxsize=self.queue_size)
+            worker[0] = self._spawn(index, len(self._workers), worker[1])
+            self.restarts += 1
+        return worker
+
+    def _stop(self) -> int:
+        """Drain and stop every live worker; returns updates lost with dead ones."""
+        lost = 0
+        for process, updates in self._workers:
+            if process.is_alive():
+                updates.put(None)
+            else:
+                lost += self._lost(process, updates)
+        for process, _ in self._workers:
+            process.join()
+        self._workers = []
+        return lost
+
+    def dispatch(self, update) -> None:
+        """Queue an update for its chat's worker; waits while that queue is full."""
+        with self._lock:
+            index = worker_index(update_chat_id(update), len(self._workers))
+            self._ensure_alive(index)[1].put(update)
+            self.dispatched += 1
+
+    def resize(self, worker_count: int) -> None:
+        """
+        Re-partition chats over worker_count workers.
+
+        Dispatching pauses while the current workers finish their queues and
+        flush their sessions, so no chat is ever handled by two workers.
+        """
+        worker_count = max(1, worker_count)
+        with self._lock:
+            if worker_count == len(self._workers):
+                return
+            print(f"Re-partitioning bot workers: {len(self._workers)} -> {worker_count}")
+            self._stop()
+            self._start(worker_count)
+
+    def close(self) -> None:
+        """Let every worker finish its queue, then stop them."""
+        with self._lock:
+            self._stop()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": len(self._workers),
+                "dispatched": self.dispatched,
+                "restarts": self.restarts,
+            }
+
+
+class PartitioningTeleBot(telebot.TeleBot):
+    """TeleBot for the ingest process: forwards each update to its chat's worker."""
+
+    def __init__(self, token, cluster, **kwargs):
+        kwargs.setdefault("threaded", False)
+        super().__init__(token, **kwargs)
+        self.cluster = cluster
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            # Advance the polling offset now; workers handle it later
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            self.cluster.dispatch(update)
+
+
+def main():
+    # Same .env as script.py, loaded here so every worker inherits it
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        raise ValueError("TELEGRAM_BOT_TOKEN environment variable is required. Create a .env file with TELEGRAM_BOT_TOKEN=your_token")
+
+    cluster = BotCluster(
+        int(os.getenv("BOT_PROCESSES", str(os.cpu_count() or 1))),
+        queue_size=int(os.getenv("BOT_QUEUE_SIZE", "1000")),
+    )
+    bot = PartitioningTeleBot(token, cluster)
+
+    # Signal handlers only queue the request; a thread does the slow part
+    resize_requests = queue.Queue()
+    signal.signal(signal.SIGUSR1, lambda signum, frame: resize_requests.put(1))
+    signal.signal(signal.SIGUSR2, lambda signum, frame: resize_requests.put(-1))
+
+    def resizer():
+        while True:
+            cluster.resize(cluster.worker_count + resize_requests.get())
+
+    threading.Thread(target=resizer, name="bot-resize", daemon=True).start()
+    # Turn SIGTERM into a normal exit so workers drain their queues
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    print(f"Started {cluster.worker_count} bot workers")
+    try:
+        # BOT_WEBHOOK_URL switches from long polling to the webhook receiver
+        webhook = webhook_from_env(bot)
+        if webhook is not None:
+            print(f"Receiving updates by webhook on port {webhook.port}")
+            webhook.serve_forever()
+        else:
+            bot.infinity_polling()
+    finally:
+        cluster.close()
+
+
+if __name__ == "__main__":
+    main()
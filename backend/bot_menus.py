@@ -0,0 +1,154 @@
+"""
+Bot keyboards and menu text compiled once from symptoms_config.Json.
+
+The /start reply keyboard, each body system's symptom keyboard and each
+follow-up question's options keyboard are built and serialized to JSON at
+load time. Telegram accepts the serialized string as reply_markup, so a
+handler sends a prebuilt keyboard without creating any markup objects.
+Follow-up steps are indexed by field id, so finding the next question is a
+dict lookup instead of a scan over the flow.
+
+The local triage engine is compiled from the same file. MenuLoader checks
+the file's modification time every few seconds and swaps in a recompiled
+CompiledMenus when it changes. If the new file is invalid, the previous
+version stays in use.
+"""
+
+import json
+import os
+import threading
+import time
+
+from telebot import types
+
+from triage_engine import TriageEngine
+
+
+class FlowStep:
+    __slots__ = ("index", "field_id", "question", "keyboard")
+
+    def __init__(self, index, field_id, question, keyboard):
+        self.index = index
+        self.field_id = field_id
+        self.question = question
+        # Serialized InlineKeyboardMarkup
+        self.keyboard = keyboard
+
+
+class CompiledMenus:
+    """Everything the bot's menus need, precomputed from one config version."""
+
+    def __init__(self, raw_config: dict, facility_data: dict):
+        self.categories = raw_config["categories"]
+        symptom_config = raw_config["symptoms"]
+        self.symptoms = {name: cfg["label"] for name, cfg in symptom_config.items()}
+        # Lowercased names for the free-text relevance check
+        self.symptom_words = tuple(name.lower() for name in self.symptoms)
+
+        self.start_keyboard = self._start_keyboard(list(self.categories.keys()))
+        self.category_keyboards = {
+            category: self._category_keyboard(names) for category, names in self.categories.items()
+        }
+        self.category_prompts = {category: f"{category}: choose a symptom below." for category in self.categories}
+
+        # symptom -> tuple of FlowStep, and symptom -> {field_id: FlowStep}
+        self.flows = {}
+        self._steps_by_field = {}
+        for name, cfg in symptom_config.items():
+            steps = tuple(
+                FlowStep(i, step["field_id"], step["question"],
+                         self._options_keyboard(name, step["field_id"], step["options"]))
+                for i, step in enumerate(cfg.get("flow", []))
+            )
+            self.flows[name] = steps
+            self._steps_by_field[name] = {step.field_id: step for step in steps}
+
+        self.triage_engine = TriageEngine(raw_config, facility_data)
+
+    @staticmethod
+    def _start_keyboard(systems):
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        # 2 systems per row
+        for i in range(0, len(systems), 2):
+            markup.add(*[types.KeyboardButton(name) for name in systems[i:i + 2]])
+        # last row is Finish
+        markup.add(types.KeyboardButton("Finish"))
+        return markup.to_json()
+
+    @staticmethod
+    def _category_keyboard(symptom_names):
+        keyboard = types.InlineKeyboardMarkup()
+        for i in range(0, len(symptom_names), 2):
+            keyboard.row(*[
+                types.InlineKeyboardButton(name, callback_data=f"symcat|{name}")
+                for name in symptom_names[i:i + 2]
+            ])
+        keyboard.add(types.InlineKeyboardButton("Back", callback_data="symcat_back"))
+        return keyboard.to_json()
+
+    @staticmethod
+    def _options_keyboard(symptom, field_id, options):
+        keyboard = types.InlineKeyboardMarkup()
+        for label, value in options:
+            keyboard.add(types.InlineKeyboardButton(label, callback_data=f"detail|{symptom}|{field_id}|{value}"))
+        return keyboard.to_json()
+
+    def next_step(self, symptom: str, details: dict, answered: str = None):
+        """
+        Next unanswered follow-up question for a symptom, or None when done.
+
+        Args:
+            symptom: Symptom name
+            details: Answers so far ({field_id: value})
+            answered: Field just answered; the search starts right after it
+        """
+        steps = self.flows.get(symptom, ())
+        start = 0
+        if answered is not None:
+            step = self._steps_by_field.get(symptom, {}).get(answered)
+            if step is not None:
+                start = step.index + 1
+        for step in steps[start:]:
+            if step.field_id not in details:
+                return step
+        if start:
+            # Earlier questions can only be open if answers came out of order
+            for step in steps[:start]:
+                if step.field_id not in details:
+                    return step
+        return None
+
+
+class MenuLoader:
+    """Serves the current CompiledMenus and recompiles when the config file changes."""
+
+    def __init__(self, config_path: str, facility_data: dict, check_interval: float = 2.0):
+        self.config_path = config_path
+        self.facility_data = facility_data
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = os.stat(config_path).st_mtime_ns
+        self._compiled = self._compile()
+        self._next_check = time.monotonic() + check_interval
+        self.reloads = 0
+
+    def _compile(self) -> CompiledMenus:
+        with open(self.config_path, "r", encoding="utf-8") as f:
+            return CompiledMenus(json.load(f), self.facility_data)
+
+    def current(self) -> CompiledMenus:
+        """Compiled menus; at most one stat() per check_interval."""
+        if time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._next_check = time.monotonic() + self.check_interval
+                mtime = os.stat(self.config_path).st_mtime_ns
+                if mtime != self._mtime:
+                    self._mtime = mtime
+                    self._compiled = self._compile()
+                    self.reloads += 1
+                    print(f"Reloaded {os.path.basename(self.config_path)}")
+            except Exception as e:
+                print(f"Warning: keeping previous symptom config, reload failed: {e}")
+            finally:
+                self._lock.release()
+        return self._compiled
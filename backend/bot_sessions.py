@@ -0,0 +1,243 @@
+"""
+Bounded session store for the Telegram bot's per-chat state.
+
+Each chat's selected symptoms, follow-up answers, current menu position and
+last scripted message live in one Session object. The store keeps at most
+max_sessions of them in memory, in LRU order. Sessions idle for longer than
+idle_ttl are dropped, and the least recently used session is evicted when
+the cap is reached, so memory stays flat however many chats the bot sees.
+
+With a database path, sessions also survive restarts and evictions.
+Sessions touched since the last flush are written back in one transaction
+every flush_interval seconds, and again on close(). A chat evicted from
+memory is reloaded from disk on its next update. Rows idle past the TTL
+are deleted by the same sweep that expires memory.
+
+Settings (environment variables, all optional):
+    BOT_SESSION_MAX      sessions kept in memory (default 100000)
+    BOT_SESSION_TTL_H    idle hours before a session is forgotten (default 72)
+    BOT_SESSION_DB       SQLite file for persistence (default bot_sessions.db, empty disables)
+    BOT_SESSION_FLUSH_S  seconds between persistence flushes (default 5)
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from storage import Database
+
+
+class Session:
+    """Conversation state for one chat."""
+
+    __slots__ = ("chat_id", "symptoms", "details", "current", "category", "last_bot_msg", "wound", "touched")
+
+    def __init__(self, chat_id, symptoms=None, details=None, current=None, category=None, last_bot_msg=None,
+                 wound=None):
+        self.chat_id = chat_id
+        # symptom -> times selected
+        self.symptoms = Counter(symptoms or {})
+        # symptom -> {field_id: answer}
+        self.details = details or {}
+        # symptom whose follow-up questions are being asked
+        self.current = current
+        # body system picked from the bottom menu
+        self.category = category
+        # id of the scripted message send_clean_message replaces next
+        self.last_bot_msg = last_bot_msg
+        # latest wound photo check: {"label": ..., "confidence": ...}
+        self.wound = wound
+        self.touched = time.time()
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "symptoms": dict(self.symptoms),
+            "details": self.details,
+            "current": self.current,
+            "category": self.category,
+            "last_bot_msg": self.last_bot_msg,
+            "wound": self.wound,
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, chat_id, raw: str) -> "Session":
+        data = json.loads(raw)
+        return cls(chat_id, data.get("symptoms"), data.get("details"), data.get("current"),
+                   data.get("category"), data.get("last_bot_msg"), data.get("wound"))
+
+
+class SessionStore:
+    """LRU + idle-TTL map of chat_id -> Session with optional SQLite persistence."""
+
+    def __init__(self, max_sessions=100000, idle_ttl=72 * 3600.0, db_path=None, flush_interval=5.0):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        # chat_id -> Session (or None for a reset) waiting to be persisted
+        self._dirty = {}
+        self.evicted = 0
+        self.expired = 0
+        self._stop = threading.Event()
+
+        self.db = None
+        if db_path:
+            self.db = Database(db_path, pool_size=2)
+            with self.db.connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS bot_sessions (
+                        chat_id INTEGER PRIMARY KEY,
+                        state TEXT NOT NULL,
+                        touched REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_bot_sessions_touched ON bot_sessions(touched)')
+        threading.Thread(target=self._run, name="bot-sessions", daemon=True).start()
+        atexit.register(self.close)
+
+    # ---- handler side ----
+
+    def get(self, chat_id) -> Session:
+        """Session for a chat, loaded or created if needed; marks it as used."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(chat_id)
+            if session is not None and now - session.touched <= self.idle_ttl:
+                self._sessions.move_to_end(chat_id)
+                session.touched = now
+                if self.db is not None:
+                    self._dirty[chat_id] = session
+                return session
+
+        session = self._load(chat_id, now) or Session(chat_id)
+        session.touched = now
+        with self._lock:
+            self._sessions[chat_id] = session
+            self._sessions.move_to_end(chat_id)
+            if self.db is not None:
+                self._dirty[chat_id] = session
+            while len(self._sessions) > self.max_sessions:
+                # The evicted session was persisted with its last change, or
+                # is written by the next flush if it is still dirty
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        return session
+
+    def reset(self, chat_id) -> None:
+        """Forget a chat's state (Finish, /start, /reset)."""
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+            if self.db is not None:
+                self._dirty[chat_id] = None
+
+    def _load(self, chat_id, now):
+        if self.db is None:
+            return None
+        with self._lock:
+            # A pending write is newer than whatever is on disk
+            if chat_id in self._dirty:
+                pending = self._dirty[chat_id]
+                if pending is None or now - pending.touched > self.idle_ttl:
+                    return None
+                return pending
+        with self.db.connection() as conn:
+            row = conn.execute(
+                'SELECT state FROM bot_sessions WHERE chat_id = ? AND touched >= ?',
+                (chat_id, now - self.idle_ttl)
+            ).fetchone()
+        return Session.from_json(chat_id, row[0]) if row else None
+
+    # ---- background maintenance ----
+
+    def expire(self) -> int:
+        """Drop sessions idle past the TTL; idle ones sit at the LRU end."""
+        cutoff = time.time() - self.idle_ttl
+        expired = 0
+        with self._lock:
+            while self._sessions:
+                chat_id, session = next(iter(self._sessions.items()))
+                if session.touched >= cutoff:
+                    break
+                self._sessions.popitem(last=False)
+                expired += 1
+            self.expired += expired
+        if self.db is not None:
+            with self.db.connection() as conn:
+                conn.execute('DELETE FROM bot_sessions WHERE touched < ?', (cutoff,))
+        return expired
+
+    def flush(self) -> int:
+        """Persist every session touched or reset since the last flush."""
+        if self.db is None:
+            return 0
+        recent = time.time() - self.flush_interval
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            rows = []
+            for chat_id, session in dirty.items():
+                if session is None:
+                    rows.append((chat_id, None, None))
+                    continue
+                try:
+                    rows.append((chat_id, session.to_json(), session.touched))
+                except RuntimeError:
+                    # A handler is mutating it right now; catch it next flush
+                    self._dirty.setdefault(chat_id, session)
+                    continue
+                if session.touched > recent:
+                    # Its handler may still be changing it; write it again next time
+                    self._dirty.setdefault(chat_id, session)
+        if not rows:
+            return 0
+        with self.db.connection() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO bot_sessions (chat_id, state, touched) VALUES (?, ?, ?)
+            ''', [row for row in rows if row[1] is not None])
+            conn.executemany('DELETE FROM bot_sessions WHERE chat_id = ?',
+                             [(row[0],) for row in rows if row[1] is None])
+        return len(rows)
+
+    def _run(self):
+        next_expire = time.time() + 60
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() >= next_expire:
+                    self.expire()
+                    next_expire = time.time() + 60
+            except Exception as e:
+                print(f"Session store: maintenance failed: {e}")
+
+    def close(self) -> None:
+        """Write pending sessions and stop the background thread."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Session store: final flush failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "dirty": len(self._dirty),
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+
+def from_env(base_dir) -> SessionStore:
+    """Build the bot's SessionStore from environment variables."""
+    db_path = os.getenv("BOT_SESSION_DB", os.path.join(base_dir, "bot_sessions.db"))
+    return SessionStore(
+        max_sessions=int(os.getenv("BOT_SESSION_MAX", "100000")),
+        idle_ttl=float(os.getenv("BOT_SESSION_TTL_H", "72")) * 3600.0,
+        db_path=db_path or None,
+        flush_interval=float(os.getenv("BOT_SESSION_FLUSH_S", "5")),
+    )
@@ -0,0 +1,244 @@
+"""
+Webhook ingestion for the Telegram bot.
+
+Instead of long polling, Telegram POSTs each update to a small HTTP
+receiver. The receiver checks the X-Telegram-Bot-Api-Secret-Token header,
+drops redeliveries of update ids it has already seen, and puts the update
+on a bounded queue before answering 200. A feeder thread hands queued
+updates to bot.process_new_updates, which runs them on the bot's per-chat
+ordered worker pool (see update_dispatcher.py). An update is handled as
+soon as it arrives, and several bot processes can sit behind a load
+balancer. Route by chat if per-chat ordering matters across processes.
+
+TLS is expected to be terminated in front of the receiver (reverse proxy
+or load balancer).
+
+Settings (environment variables):
+    BOT_WEBHOOK_URL       public HTTPS URL Telegram posts to; enables webhook mode
+    BOT_WEBHOOK_SECRET    secret token Telegram sends with every update (required)
+    BOT_WEBHOOK_HOST      listen address (default 0.0.0.0)
+    BOT_WEBHOOK_PORT      listen port (default 8443)
+    BOT_WEBHOOK_REGISTER  call setWebhook on startup (default 1)
+    BOT_WEBHOOK_RECORD    append every accepted update to this NDJSON file
+
+Replaying recorded updates against a local receiver:
+    python3 bot_webhook.py updates.ndjson --url http://localhost:8443/telegram --secret s3cret
+"""
+
+import argparse
+import hmac
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import requests
+import telebot
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Largest update body accepted (Telegram updates are a few KB)
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class WebhookReceiver:
+    """HTTP endpoint that validates Telegram updates and queues them for the bot."""
+
+    def __init__(self, bot, secret, host="0.0.0.0", port=8443, path="/telegram",
+                 queue_size=1000, record_path=None, seen_ids=10000):
+        """
+        Args:
+            bot: TeleBot whose process_new_updates receives each update
+            secret: Expected secret token header value
+            host: Listen address
+            port: Listen port
+            path: URL path updates are posted to
+            queue_size: Updates buffered before the receiver answers 503
+            record_path: Optional NDJSON file every accepted update is appended to
+            seen_ids: Recent update ids remembered to drop redeliveries
+        """
+        if not secret:
+            raise ValueError("BOT_WEBHOOK_SECRET is required in webhook mode")
+        self.bot = bot
+        self.secret = secret.encode("utf-8")
+        self.path = path
+        self.record_path = record_path
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._seen = set()
+        self._seen_order = deque(maxlen=seen_ids)
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    def _handler_class(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                status = receiver.receive(self.path, self.headers, self.rfile)
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                # One line per update is too noisy for the bot's console
+                pass
+
+        return Handler
+
+    def receive(self, path, headers, body_stream) -> int:
+        """Validate and queue one update; returns the HTTP status to answer with."""
+        if path != self.path:
+            return 404
+
+        token = headers.get(SECRET_HEADER, "").encode("utf-8")
+        if not hmac.compare_digest(token, self.secret):
+            self.rejected += 1
+            return 403
+
+        try:
+            length = int(headers.get("Content-Length", "0"))
+        except ValueError:
+            return 400
+        if not 0 < length <= MAX_BODY_BYTES:
+            return 413 if length > MAX_BODY_BYTES else 400
+
+        raw = body_stream.read(length)
+        try:
+            data = json.loads(raw)
+            update_id = data["update_id"]
+        except (ValueError, KeyError, TypeError):
+            return 400
+
+        with self._lock:
+            if update_id in self._seen:
+                # Telegram redelivers until it gets a 2xx; acknowledge again
+                self.duplicates += 1
+                return 200
+            try:
+                self._queue.put_nowait(data)
+            except queue.Full:
+                # Telegram retries later
+                return 503
+            if len(self._seen_order) == self._seen_order.maxlen:
+                self._seen.discard(self._seen_order[0])
+            self._seen_order.append(update_id)
+            self._seen.add(update_id)
+            self.accepted += 1
+
+        if self.record_path:
+            with self._lock, open(self.record_path, "ab") as f:
+                f.write(raw.strip() + b"\n")
+        return 200
+
+    def _feed(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            try:
+                self.bot.process_new_updates([telebot.types.Update.de_json(data)])
+            except Exception as e:
+                print(f"Webhook: could not dispatch update {data.get('update_id')}: {e}")
+
+    def start(self) -> None:
+        """Serve in background threads."""
+        threading.Thread(target=self._feed, name="webhook-feed", daemon=True).start()
+        threading.Thread(target=self._server.serve_forever, name="webhook-http", daemon=True).start()
+
+    def serve_forever(self) -> None:
+        """Serve on the calling thread until interrupted."""
+        threading.Thread(target=self._feed, name="webhook-feed", daemon=True).start()
+        try:
+            self._server.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._queue.put(None)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def stats(self) -> dict:
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "queued": self._queue.qsize(),
+        }
+
+
+def from_env(bot):
+    """
+    Build a WebhookReceiver from environment variables and register the
+    webhook with Telegram, or return None to keep long polling.
+    """
+    url = os.getenv("BOT_WEBHOOK_URL")
+    if not url:
+        return None
+    secret = os.getenv("BOT_WEBHOOK_SECRET", "")
+    receiver = WebhookReceiver(
+        bot,
+        secret,
+        host=os.getenv("BOT_WEBHOOK_HOST", "0.0.0.0"),
+        port=int(os.getenv("BOT_WEBHOOK_PORT", "8443")),
+        path=urlparse(url).path or "/",
+        record_path=os.getenv("BOT_WEBHOOK_RECORD") or None,
+    )
+    if os.getenv("BOT_WEBHOOK_REGISTER", "1") == "1":
+        bot.remove_webhook()
+        bot.set_webhook(url=url, secret_token=secret)
+    return receiver
+
+
+def replay(path, url, secret, rate=0.0) -> dict:
+    """
+    Post recorded updates (one JSON object per line) to a receiver.
+
+    Args:
+        path: NDJSON file, e.g. written with BOT_WEBHOOK_RECORD
+        url: Receiver URL
+        secret: Secret token to send
+        rate: Updates per second (0 = as fast as possible)
+
+    Returns:
+        dict: Count of responses per HTTP status
+    """
+    statuses = {}
+    session = requests.Session()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            resp = session.post(url, data=line.strip().encode("utf-8"), timeout=10, headers={
+                "Content-Type": "application/json",
+                SECRET_HEADER: secret,
+            })
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+            if rate > 0:
+                time.sleep(1.0 / rate)
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Telegram updates against a webhook receiver")
+    parser.add_argument("file", help="NDJSON file of recorded updates")
+    parser.add_argument("--url", default="http://localhost:8443/telegram")
+    parser.add_argument("--secret", default=os.getenv("BOT_WEBHOOK_SECRET", ""))
+    parser.add_argument("--rate", type=float, default=0.0, help="Updates per second (0 = unthrottled)")
+    args = parser.parse_args()
+    print(json.dumps(replay(args.file, args.url, args.secret, args.rate)))
+
+
+if __name__ == "__main__":
+    main()
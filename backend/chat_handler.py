@@ -6,27 +6,25 @@ This is separate from script.py to keep the Telegram bot unchanged.
 import os
 import json
 from collections import Counter
-import google.generativeai as genai
 from dotenv import load_dotenv
+from llm_provider import get_llm
+from llm_scheduler import FOLLOWUP, FREE_TEXT
 
 # Load environment variables from .env file (in parent directory)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PARENT_DIR = os.path.dirname(BASE_DIR)
 load_dotenv(dotenv_path=os.path.join(PARENT_DIR, '.env'))
 
-# Initialize Gemini (same as script.py)
-# Get API key from environment variable (DO NOT HARD CODE)
-GENAI_KEY = os.getenv("GEMINI_API_KEY")
-if GENAI_KEY:
-    try:
-        genai.configure(api_key=GENAI_KEY)
-        model = genai.GenerativeModel("models/gemini-2.5-pro")
-    except Exception as e:
-        print(f"Warning: Failed to initialize Gemini model: {e}")
-        model = None
-else:
-    print("Warning: GEMINI_API_KEY environment variable not set")
-    model = None
+# Initialize the LLM backend (same as script.py)
+# Gemini reads its API key from the environment (DO NOT HARD CODE);
+# set LLM_BACKEND=fake to run against the local latency-simulating fake.
+try:
+    llm = get_llm()
+    if llm is None:
+        print("Warning: GEMINI_API_KEY environment variable not set")
+except Exception as e:
+    print(f"Warning: Failed to initialize LLM backend: {e}")
+    llm = None
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PARENT_DIR = os.path.dirname(BASE_DIR)
@@ -55,12 +53,15 @@ except Exception:
     pass
 
 
-def gemini_chat_reply(user_text, counts=None, details=None):
+def gemini_chat_reply(user_text, counts=None, details=None, priority=FREE_TEXT, flow=None):
     """
     Generate a chat reply using Gemini AI.
     Same logic as script.py but adapted for API use.
+
+    priority and flow (usually the wallet address) are passed to the LLM
+    scheduler so follow-ups go first and each wallet gets a fair share.
     """
-    if model is None:
+    if llm is None:
         return "Chat service is not configured. Please set GEMINI_API_KEY environment variable."
     
     counts = counts or Counter()
@@ -81,18 +82,18 @@ Provide clear, concise health guidance.
 """
 
     try:
-        resp = model.generate_content(prompt)
-        return (resp.text or "").strip() or "I could not respond."
+        return llm.generate(prompt, priority=priority, flow=flow).strip() or "I could not respond."
     except Exception as e:
         return f"I could not respond. Error: {str(e)}"
 
 
-def chat_with_context(messages):
+def chat_with_context(messages, wallet_address=None):
     """
     Process chat messages and return a response.
     
     Args:
         messages: List of message dicts with 'role' and 'content'
+        wallet_address: Optional wallet used for fair LLM scheduling
     
     Returns:
         str: Response text
@@ -118,5 +119,14 @@ def chat_with_context(messages):
         if keyword in user_text_lower:
             counts[keyword] += 1
     
-    return gemini_chat_reply(last_user_message, counts, details)
+    # a reply inside an ongoing conversation is a follow-up
+    priority = FOLLOWUP if len(user_messages) > 1 else FREE_TEXT
+    flow = wallet_address.lower() if wallet_address else None
+    return gemini_chat_reply(last_user_message, counts, details, priority=priority, flow=flow)
+
 
+def llm_stats():
+    """Return LLM client counters (e.g. coalesced duplicate calls) for monitoring."""
+    if llm is None or not hasattr(llm, "stats"):
+        return None
+    return llm.stats()
@@ -0,0 +1,222 @@
+"""
+Write-behind group commit for chat message persistence.
+
+Request threads enqueue a chat turn and return immediately; one background
+writer drains the queue and applies every pending turn, across many
+conversations, in a single transaction per flush. Under load this replaces
+one fsync and one write-lock round per request with one per flush interval.
+
+Durability (CHAT_WRITE_DURABILITY):
+    async   (default) return as soon as the turn is queued; a crash can lose
+            up to one flush interval of messages
+    commit  wait until the batch holding the turn has committed; still group
+            commits across concurrent requests. enqueue() raises
+            ChatWriteError if the turn was dropped instead
+
+Reads stay consistent for the writer's own user: barrier(wallet) waits for
+that wallet's queued turns to commit before a history query runs.
+Pending writes are drained by close(), which is registered with atexit.
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from archive import restore_conversation
+
+
+class ChatWriteError(Exception):
+    """Raised by enqueue() in 'commit' mode when the turn could not be written."""
+
+
+class ChatTurn:
+    """Everything one /chat request persists."""
+
+    __slots__ = ("conversation_id", "wallet_address", "title", "messages", "updated_at", "seq")
+
+    def __init__(self, conversation_id, wallet_address, messages, title=None, updated_at=None):
+        self.conversation_id = conversation_id
+        self.wallet_address = wallet_address.lower()
+        # Set only when the turn starts a new conversation; otherwise a new
+        # conversation is titled after its first message
+        self.title = title
+        # List of (role, content)
+        self.messages = messages
+        self.updated_at = updated_at or datetime.now()
+        self.seq = 0
+
+
+class ChatWriter:
+    """Single background writer that batches chat turns into one transaction."""
+
+    def __init__(self, db, flush_interval=0.05, max_batch=500, durability="async"):
+        if durability not in ("async", "commit"):
+            raise ValueError(f"Unknown durability '{durability}'. Use 'async' or 'commit'.")
+        self.db = db
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.durability = durability
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._next_seq = 1
+        self._committed_seq = 0
+        self._last_seq_by_wallet = {}
+        # seq -> error for dropped turns, waiting to be raised ('commit' mode only)
+        self._errors = {}
+        self._closed = False
+        self.batches = 0
+        self.turns_written = 0
+        self.failed_turns = 0
+        self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- request side ----
+
+    def enqueue(self, turn: ChatTurn) -> None:
+        """Queue a chat turn; in 'commit' mode, block until it is committed."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Chat writer is closed")
+            turn.seq = self._next_seq
+            self._next_seq += 1
+            self._last_seq_by_wallet[turn.wallet_address] = turn.seq
+            self._pending.append(turn)
+            self._cond.notify_all()
+
+        if self.durability == "commit":
+            self._wait_for(turn.seq)
+            with self._cond:
+                error = self._errors.pop(turn.seq, None)
+            if error is not None:
+                raise ChatWriteError(f"Chat turn was not saved: {error}") from error
+
+    def barrier(self, wallet_address: str, timeout: float = 5.0) -> None:
+        """Wait until every queued turn for this wallet has been committed."""
+        with self._cond:
+            seq = self._last_seq_by_wallet.get(wallet_address.lower())
+        if seq is not None:
+            self._wait_for(seq, timeout)
+
+    def _wait_for(self, seq, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self._committed_seq >= seq, timeout)
+
+    # ---- writer side ----
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+
+            # Let concurrent requests join this batch
+            if not self._closed:
+                time.sleep(self.flush_interval)
+
+            with self._cond:
+                batch = []
+                while self._pending and len(batch) < self.max_batch:
+                    batch.append(self._pending.popleft())
+
+            errors = self._write(batch)
+
+            with self._cond:
+                if self.durability == "commit":
+                    self._errors.update(errors)
+                self._committed_seq = batch[-1].seq
+                for turn in batch:
+                    if self._last_seq_by_wallet.get(turn.wallet_address) == turn.seq:
+                        del self._last_seq_by_wallet[turn.wallet_address]
+                self._cond.notify_all()
+
+    @staticmethod
+    def _apply(c, turn):
+        # Continuing an archived conversation (titled or not) brings it back to
+        # the hot tables first, so the upsert below never shadows the archive
+        restore_conversation(c, turn.conversation_id, turn.wallet_address)
+        # Creates the conversation on its first turn (titled after its first
+        # message unless a title is given) and bumps updated_at afterwards.
+        # Upsert rather than REPLACE so the trigger-maintained summary columns survive.
+        c.execute('''
+            INSERT INTO conversations (id, wallet_address, title, updated_at)
+            VALUES (:id, :wallet, COALESCE(:title, :default_title), :updated_at)
+            ON CONFLICT(id) DO UPDATE SET
+                title = COALESCE(:title, conversations.title),
+                updated_at = excluded.updated_at
+            WHERE conversations.wallet_address = excluded.wallet_address
+        ''', {
+            'id': turn.conversation_id,
+            'wallet': turn.wallet_address,
+            'title': turn.title,
+            'default_title': (turn.messages[0][1] if turn.messages else '')[:50] or 'New Chat',
+            'updated_at': turn.updated_at,
+        })
+        # Never append to a conversation owned by another wallet
+        c.executemany('''
+            INSERT INTO messages (conversation_id, wallet_address, role, content)
+            SELECT ?1, ?2, ?3, ?4
+            WHERE EXISTS (SELECT 1 FROM conversations WHERE id = ?1 AND wallet_address = ?2)
+        ''', [(turn.conversation_id, turn.wallet_address, role, content) for role, content in turn.messages])
+
+    def _write(self, batch) -> dict:
+        """Commit a batch; returns {seq: error} for the turns that were dropped."""
+        try:
+            with self.db.connection() as conn:
+                c = conn.cursor()
+                for turn in batch:
+                    self._apply(c, turn)
+            self.batches += 1
+            self.turns_written += len(batch)
+            return {}
+        except Exception as e:
+            print(f"Chat writer: batch of {len(batch)} failed ({e}), retrying turns one by one")
+
+        # Isolate the bad turn so one failure does not drop the whole batch
+        errors = {}
+        for turn in batch:
+            try:
+                with self.db.connection() as conn:
+                    self._apply(conn.cursor(), turn)
+                self.turns_written += 1
+            except Exception as e:
+                self.failed_turns += 1
+                errors[turn.seq] = e
+                print(f"Chat writer: dropped turn for conversation {turn.conversation_id}: {e}")
+        return errors
+
+    # ---- lifecycle ----
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stop accepting turns and drain everything still queued."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "batches": self.batches,
+                "turns_written": self.turns_written,
+                "failed_turns": self.failed_turns,
+                "durability": self.durability,
+            }
+
+
+def from_env(db) -> ChatWriter:
+    """Build a ChatWriter configured from environment variables."""
+    return ChatWriter(
+        db,
+        flush_interval=float(os.getenv("CHAT_WRITE_FLUSH_MS", "50")) / 1000.0,
+        max_batch=int(os.getenv("CHAT_WRITE_MAX_BATCH", "500")),
+        durability=os.getenv("CHAT_WRITE_DURABILITY", "async"),
+    )
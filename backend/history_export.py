@@ -0,0 +1,274 @@
+"""
+Streaming NDJSON export and import of one wallet's chat history.
+
+The export is one JSON object per line: a header, then each conversation
+followed by its messages in chronological order. Hot and archived
+conversations are both included. Rows are read in keyset pages, and the
+pooled connection is released between pages, so memory stays flat however
+large the history is and a slow download never pins a read snapshot.
+
+Import is idempotent. Conversations are upserted by id, and a message is
+skipped if its conversation already holds a message with the same
+created_at, role and content. Re-importing a file, or importing into a
+deployment that already has part of the history, never duplicates rows.
+Rows are written with executemany, batch_size rows per transaction.
+
+Usage:
+    python3 history_export.py export --wallet 0xabc... -o history.ndjson
+    python3 history_export.py import --wallet 0xabc... history.ndjson
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+from archive import decompress_messages, restore_conversation
+
+EXPORT_FORMAT = "nexahealth-chat-history"
+EXPORT_VERSION = 1
+
+# Rows per keyset page when exporting
+PAGE_SIZE = 500
+# Rows per transaction when importing
+BATCH_SIZE = 5000
+
+
+def _line(obj) -> str:
+    return json.dumps(obj, separators=(',', ':'), default=str) + '\n'
+
+
+def _pages(db, sql, params, key_columns, page_size):
+    """
+    Yield rows of an ORDER BY query in keyset pages, one short read per page.
+
+    The query selects the key_columns last and has a {keyset} placeholder.
+    """
+    cursor = None
+    while True:
+        with db.connection() as conn:
+            if cursor is None:
+                rows = conn.execute(sql.format(keyset=''), params + (page_size,)).fetchall()
+            else:
+                keyset = f"AND ({', '.join(key_columns)}) > ({', '.join('?' * len(key_columns))})"
+                rows = conn.execute(sql.format(keyset=keyset), params + cursor + (page_size,)).fetchall()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        cursor = tuple(rows[-1][-len(key_columns):])
+
+
+def export_wallet(db, wallet_address: str, page_size: int = PAGE_SIZE):
+    """
+    Stream a wallet's history as NDJSON lines.
+
+    Args:
+        db: storage.Database holding the wallet (its shard)
+        wallet_address: Wallet to export
+        page_size: Rows read per query
+
+    Yields:
+        str: One JSON line
+    """
+    wallet_address = wallet_address.lower()
+    yield _line({
+        'type': 'header',
+        'format': EXPORT_FORMAT,
+        'version': EXPORT_VERSION,
+        'wallet_address': wallet_address,
+        'exported_at': datetime.now(),
+    })
+
+    conversations = _pages(db, '''
+        SELECT title, created_at, updated_at, id
+        FROM conversations
+        WHERE wallet_address = ? {keyset}
+        ORDER BY updated_at, id
+        LIMIT ?
+    ''', (wallet_address,), ('updated_at', 'id'), page_size)
+    for title, created_at, updated_at, conversation_id in conversations:
+        yield _line({'type': 'conversation', 'id': conversation_id, 'title': title,
+                     'created_at': created_at, 'updated_at': updated_at})
+        messages = _pages(db, '''
+            SELECT role, content, created_at, id
+            FROM messages
+            WHERE conversation_id = ? AND wallet_address = ? {keyset}
+            ORDER BY created_at, id
+            LIMIT ?
+        ''', (conversation_id, wallet_address), ('created_at', 'id'), page_size)
+        for role, content, message_created_at, _ in messages:
+            yield _line({'type': 'message', 'conversation_id': conversation_id, 'role': role,
+                         'content': content, 'created_at': message_created_at})
+
+    archived = _pages(db, '''
+        SELECT title, created_at, messages_blob, updated_at, id
+        FROM archived_conversations
+        WHERE wallet_address = ? {keyset}
+        ORDER BY updated_at, id
+        LIMIT ?
+    ''', (wallet_address,), ('updated_at', 'id'), page_size)
+    for title, created_at, blob, updated_at, conversation_id in archived:
+        yield _line({'type': 'conversation', 'id': conversation_id, 'title': title,
+                     'created_at': created_at, 'updated_at': updated_at})
+        for _, role, content, message_created_at in decompress_messages(blob):
+            yield _line({'type': 'message', 'conversation_id': conversation_id, 'role': role,
+                         'content': content, 'created_at': message_created_at})
+
+
+class _Importer:
+    """Buffers parsed rows and writes them in batched transactions."""
+
+    def __init__(self, db, wallet_address, batch_size):
+        self.db = db
+        self.wallet_address = wallet_address
+        self.batch_size = batch_size
+        self.conversations = []
+        self.messages = []
+        self.counts = {'conversations': 0, 'conversations_skipped': 0,
+                       'messages_imported': 0, 'messages_skipped': 0}
+
+    def add_conversation(self, row):
+        self.conversations.append(row)
+        if len(self.conversations) + len(self.messages) >= self.batch_size:
+            self.flush()
+
+    def add_message(self, row):
+        self.messages.append(row)
+        if len(self.conversations) + len(self.messages) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.conversations and not self.messages:
+            return
+        with self.db.connection() as conn:
+            c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE')
+            for row in self.conversations:
+                # Merge into an archived copy instead of duplicating it
+                restore_conversation(c, row[0], self.wallet_address)
+            # Only ever touches conversations owned by this wallet, and never
+            # claims an id another wallet has in the archive
+            c.executemany('''
+                INSERT INTO conversations (id, wallet_address, title, created_at, updated_at)
+                SELECT ?1, ?2, ?3, ?4, ?5
+                WHERE NOT EXISTS (SELECT 1 FROM archived_conversations WHERE id = ?1 AND wallet_address != ?2)
+                ON CONFLICT(id) DO UPDATE SET
+                    title = COALESCE(excluded.title, conversations.title),
+                    updated_at = MAX(conversations.updated_at, excluded.updated_at)
+                WHERE conversations.wallet_address = excluded.wallet_address
+            ''', self.conversations)
+            # Rows the ownership guards skipped are not counted
+            merged = max(c.rowcount, 0)
+            # Served by idx_messages_conversation_created
+            c.executemany('''
+                INSERT INTO messages (conversation_id, wallet_address, role, content, created_at)
+                SELECT ?1, ?2, ?3, ?4, ?5
+                WHERE EXISTS (SELECT 1 FROM conversations WHERE id = ?1 AND wallet_address = ?2)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM messages
+                      WHERE conversation_id = ?1 AND created_at = ?5 AND role = ?3 AND content = ?4
+                  )
+            ''', self.messages)
+            imported = max(c.rowcount, 0)
+        self.counts['conversations'] += merged
+        self.counts['conversations_skipped'] += len(self.conversations) - merged
+        self.counts['messages_imported'] += imported
+        self.counts['messages_skipped'] += len(self.messages) - imported
+        self.conversations = []
+        self.messages = []
+
+
+def import_wallet(db, wallet_address: str, lines, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Import NDJSON lines produced by export_wallet into a wallet's history.
+
+    Every row is stored under wallet_address, whatever wallet the file was
+    exported from. Batches already written stay written if a later line is
+    invalid; fixing the file and importing again is safe.
+
+    Args:
+        db: storage.Database holding the wallet (its shard)
+        wallet_address: Wallet that will own the imported history
+        lines: Iterable of str or bytes lines
+        batch_size: Rows per transaction
+
+    Returns:
+        dict: Conversations and messages imported, and those skipped (already
+            present, or conversations owned by another wallet)
+
+    Raises:
+        ValueError: If a line is not a valid export record
+    """
+    wallet_address = wallet_address.lower()
+    importer = _Importer(db, wallet_address, batch_size)
+    now = str(datetime.now())
+
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            kind = record['type']
+            if kind == 'header':
+                if record.get('format') != EXPORT_FORMAT or record.get('version') != EXPORT_VERSION:
+                    raise ValueError('unsupported export format')
+            elif kind == 'conversation':
+                importer.add_conversation((
+                    str(record['id']), wallet_address, record.get('title'),
+                    record.get('created_at') or now, record.get('updated_at') or now
+                ))
+            elif kind == 'message':
+                if record['role'] not in ('user', 'assistant'):
+                    raise ValueError(f"invalid role '{record['role']}'")
+                importer.add_message((
+                    str(record['conversation_id']), wallet_address, record['role'],
+                    str(record['content']), record.get('created_at') or now
+                ))
+            else:
+                raise ValueError(f"unknown record type '{kind}'")
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Line {number}: {e}") from e
+
+    importer.flush()
+    return importer.counts
+
+
+def main():
+    from sharding import ShardedStore
+
+    parser = argparse.ArgumentParser(description="Export or import a wallet's chat history as NDJSON")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("--wallet", required=True, help="Wallet address")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_history.db"),
+                        help="Path of the unsharded database")
+    parser.add_argument("-o", "--output", help="Export file (default stdout)")
+    parser.add_argument("file", nargs="?", help="File to import (default stdin)")
+    args = parser.parse_args()
+
+    store = ShardedStore(args.db, shard_count=int(os.getenv("CHAT_DB_SHARDS", "1")), pool_size=1)
+    db = store.db_for(args.wallet)
+    try:
+        if args.command == "export":
+            out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+            try:
+                out.writelines(export_wallet(db, args.wallet))
+            finally:
+                if args.output:
+                    out.close()
+        else:
+            source = open(args.file, "r", encoding="utf-8") if args.file else sys.stdin
+            try:
+                counts = import_wallet(db, args.wallet, source)
+            finally:
+                if args.file:
+                    source.close()
+            print(json.dumps(counts), file=sys.stderr)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Telegram bot chat history sync.
+
+The bot writes its triage sessions and chat turns into the same
+conversations/messages tables the web app reads, so a linked wallet sees
+Telegram history in /chat/history. Writes go through the wallet's shard
+(see sharding.py) and its batched ChatWriter and never block a bot reply;
+the chat_id -> wallet map is held in memory and warmed from every shard's
+wallet_telegram_links at startup.
+"""
+
+import threading
+import uuid
+
+from chat_writer import ChatTurn
+
+
+class TelegramHistorySync:
+    """Maps Telegram chats to wallets and records their conversations."""
+
+    def __init__(self, store):
+        # sharding.ShardedStore opened with a writer_factory
+        self.store = store
+        self._lock = threading.Lock()
+        # str(chat_id) -> wallet address
+        self._wallets = {}
+        # chat_id -> id of the conversation currently being recorded
+        self._conversations = {}
+
+    def warm(self) -> int:
+        """Load every existing Telegram link into memory."""
+        rows = []
+        for shard in self.store.shards:
+            with shard.db.connection() as conn:
+                rows += conn.execute(
+                    'SELECT telegram_user_id, wallet_address FROM wallet_telegram_links'
+                ).fetchall()
+        with self._lock:
+            self._wallets.update(rows)
+        return len(rows)
+
+    def link(self, chat_id, wallet_address: str) -> None:
+        """Remember a newly confirmed link so later turns are synced."""
+        with self._lock:
+            self._wallets[str(chat_id)] = wallet_address.lower()
+
+    def wallet_for(self, chat_id):
+        with self._lock:
+            return self._wallets.get(str(chat_id))
+
+    def record(self, chat_id, messages, title=None) -> None:
+        """
+        Queue messages for the chat's current conversation.
+
+        Args:
+            chat_id: Telegram chat id
+            messages: List of (role, content) tuples
+            title: Title used if this starts a new conversation
+        """
+        wallet_address = self.wallet_for(chat_id)
+        if not wallet_address or not messages:
+            return
+
+        with self._lock:
+            conversation_id = self._conversations.get(chat_id)
+            new_conversation = conversation_id is None
+            if new_conversation:
+                conversation_id = str(uuid.uuid4())
+                self._conversations[chat_id] = conversation_id
+
+        if new_conversation:
+            title = (title or messages[0][1] or "Telegram chat")[:50]
+        else:
+            title = None
+
+        self.store.writer_for(wallet_address).enqueue(ChatTurn(conversation_id, wallet_address, messages, title=title))
+
+    def end_session(self, chat_id) -> None:
+        """Close the current conversation; the next turn starts a new one."""
+        with self._lock:
+            self._conversations.pop(chat_id, None)
@@ -0,0 +1,96 @@
+"""
+Singleflight coalescing of identical in-flight LLM requests.
+
+When the same prompt is already being generated (a Telegram double-tap on
+Finish, a frontend retry of /chat after a client-side timeout), later callers
+wait for the first upstream call and share its result instead of issuing a
+duplicate generate_content call.
+"""
+
+import hashlib
+import threading
+
+from llm_provider import LLMProvider
+
+
+def canonical_prompt_key(prompt: str) -> str:
+    """
+    Build the coalescing key for a prompt.
+
+    Whitespace differences (indentation, trailing newlines) do not change
+    what the model sees in any meaningful way, so they are collapsed.
+    """
+    canonical = " ".join(prompt.split())
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _InflightCall:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class CoalescingProvider(LLMProvider):
+    """Wraps another provider so concurrent identical prompts share one call."""
+
+    def __init__(self, inner: LLMProvider):
+        self.inner = inner
+        self.name = inner.name
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.requests = 0
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    def generate(self, prompt: str, **options) -> str:
+        key = canonical_prompt_key(prompt)
+
+        with self._lock:
+            self.requests += 1
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _InflightCall()
+                self._inflight[key] = call
+                self.upstream_calls += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self.inner.generate(prompt, **options)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.done.set()
+
+    def stream(self, prompt: str, **options):
+        # Streams are consumed incrementally by a single caller; pass through
+        return self.inner.stream(prompt, **options)
+
+    def stats(self) -> dict:
+        """Counters for monitoring how many upstream calls were saved."""
+        with self._lock:
+            stats = {
+                "requests": self.requests,
+                "upstream_calls": self.upstream_calls,
+                "coalesced": self.coalesced,
+                "inflight": len(self._inflight),
+            }
+        if hasattr(self.inner, "stats"):
+            stats.update(self.inner.stats())
+        return stats
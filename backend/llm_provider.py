@@ -0,0 +1,239 @@
+"""
+Pluggable LLM backends for the web chat and the Telegram bot.
+
+chat_handler.py and script.py talk to an LLMProvider instead of importing
+google.generativeai directly, so the full request path can be load-tested
+offline against FakeProvider.
+
+Select the backend with the LLM_BACKEND environment variable:
+    LLM_BACKEND=gemini   (default) real Gemini model, needs GEMINI_API_KEY
+    LLM_BACKEND=fake     local fake with simulated latency and errors
+
+Fake backend settings (all optional):
+    FAKE_LLM_LATENCY     latency distribution spec, e.g. "lognormal:800:0.5"
+    FAKE_LLM_ERROR_RATE  fraction of calls that raise, e.g. "0.02"
+    FAKE_LLM_CHUNK_MS    delay between streamed chunks in milliseconds
+    FAKE_LLM_SEED        random seed for reproducible runs
+"""
+
+import os
+import random
+import threading
+import time
+
+DEFAULT_GEMINI_MODEL = "models/gemini-2.5-pro"
+
+
+class LLMError(Exception):
+    """Raised when the upstream model fails to produce a response."""
+
+
+class LLMProvider:
+    """Minimal interface shared by all LLM backends."""
+
+    name = "base"
+
+    def generate(self, prompt: str, **options) -> str:
+        """Return the full response text for a prompt.
+
+        Options such as priority and flow are scheduling hints for wrapper
+        layers; backends ignore the ones they do not understand.
+        """
+        raise NotImplementedError
+
+    def stream(self, prompt: str, **options):
+        """Yield response text chunks as they arrive.
+
+        Backends without native streaming return the whole reply as one chunk.
+        """
+        yield self.generate(prompt, **options)
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini backend (the production default)."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str = DEFAULT_GEMINI_MODEL, timeout=None):
+        # Imported lazily so the fake backend works without the SDK installed
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        # Transport-level timeout so abandoned calls do not hold a worker forever
+        self.request_options = {"timeout": timeout} if timeout else None
+
+    def generate(self, prompt: str, **options) -> str:
+        try:
+            resp = self.model.generate_content(prompt, request_options=self.request_options)
+            return resp.text or ""
+        except Exception as e:
+            raise LLMError(str(e)) from e
+
+    def stream(self, prompt: str, **options):
+        try:
+            for chunk in self.model.generate_content(prompt, stream=True, request_options=self.request_options):
+                text = getattr(chunk, "text", "")
+                if text:
+                    yield text
+        except Exception as e:
+            raise LLMError(str(e)) from e
+
+
+def parse_latency_spec(spec: str):
+    """
+    Build a latency sampler from a spec string. Values are in milliseconds.
+
+    Supported forms:
+        "fixed:500"              always 500ms
+        "uniform:200:1200"       uniform between 200ms and 1200ms
+        "normal:800:150"         normal with mean 800ms, stddev 150ms
+        "lognormal:800:0.5"      lognormal with median 800ms, sigma 0.5
+        "exponential:600"        exponential with mean 600ms
+
+    Returns:
+        Callable taking a random.Random and returning seconds
+    """
+    parts = [p.strip() for p in (spec or "fixed:0").split(":")]
+    kind, args = parts[0].lower(), [float(p) for p in parts[1:]]
+
+    try:
+        if kind == "fixed":
+            ms = args[0]
+            return lambda rng: ms / 1000.0
+        if kind == "uniform":
+            low, high = args[0], args[1]
+            return lambda rng: rng.uniform(low, high) / 1000.0
+        if kind == "normal":
+            mean, stddev = args[0], args[1]
+            return lambda rng: max(0.0, rng.gauss(mean, stddev)) / 1000.0
+        if kind == "lognormal":
+            import math
+            mu, sigma = math.log(max(args[0], 1e-3)), args[1]
+            return lambda rng: rng.lognormvariate(mu, sigma) / 1000.0
+        if kind == "exponential":
+            mean = args[0]
+            return lambda rng: rng.expovariate(1.0 / mean) / 1000.0 if mean > 0 else 0.0
+    except IndexError:
+        raise ValueError(f"Latency spec '{spec}' is missing parameters")
+
+    raise ValueError(f"Unknown latency distribution '{kind}'")
+
+
+class FakeProvider(LLMProvider):
+    """
+    Local stand-in for Gemini used for load tests and offline development.
+
+    Replies are canned but shaped like the real ones: triage prompts get a
+    "Severity:" line so extract_urgency_from_summary keeps working.
+    """
+
+    name = "fake"
+
+    SEVERITIES = [
+        "self-care",
+        "urgent care",
+        "ER",
+        "Trauma center",
+        "Appointment with provider",
+    ]
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, chunk_ms=0.0, seed=None):
+        self.sample_latency = parse_latency_spec(latency) if isinstance(latency, str) else latency
+        self.error_rate = float(error_rate)
+        self.chunk_delay = float(chunk_ms) / 1000.0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _draw(self):
+        # random.Random is not safe to share across threads without a lock
+        with self._lock:
+            self.calls += 1
+            return self.sample_latency(self._rng), self._rng.random(), self._rng.randrange(1 << 30)
+
+    def _reply_for(self, prompt: str, token: int) -> str:
+        if "Severity:" in prompt:
+            severity = self.SEVERITIES[token % len(self.SEVERITIES)]
+            return (
+                "Your symptoms may come from a common, passing illness.\n"
+                f"Severity: {severity}\n"
+                "Watch for trouble breathing, chest pain or confusion.\n"
+                "This is not medical advice."
+            )
+        return (
+            "Thanks for sharing. Rest, drink fluids and keep track of how you feel. "
+            "If things get worse, contact a provider. This is not medical advice."
+        )
+
+    def generate(self, prompt: str, **options) -> str:
+        latency, roll, token = self._draw()
+        time.sleep(latency)
+        if roll < self.error_rate:
+            raise LLMError("Simulated upstream failure")
+        return self._reply_for(prompt, token)
+
+    def stream(self, prompt: str, **options):
+        latency, roll, token = self._draw()
+        # Latency models time-to-first-chunk; chunk_delay models the rest
+        time.sleep(latency)
+        if roll < self.error_rate:
+            raise LLMError("Simulated upstream failure")
+        lines = self._reply_for(prompt, token).splitlines(keepends=True)
+        for i, line in enumerate(lines):
+            if i and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield line
+
+
+def get_provider(backend=None):
+    """
+    Create the LLM provider selected by LLM_BACKEND.
+
+    Returns:
+        LLMProvider instance, or None if the Gemini backend has no API key
+    """
+    backend = (backend or os.getenv("LLM_BACKEND", "gemini")).lower()
+
+    if backend == "fake":
+        seed = os.getenv("FAKE_LLM_SEED")
+        return FakeProvider(
+            latency=os.getenv("FAKE_LLM_LATENCY", "lognormal:800:0.5"),
+            error_rate=os.getenv("FAKE_LLM_ERROR_RATE", "0"),
+            chunk_ms=os.getenv("FAKE_LLM_CHUNK_MS", "40"),
+            seed=int(seed) if seed else None,
+        )
+
+    if backend == "gemini":
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            return None
+        timeout = os.getenv("GEMINI_TIMEOUT_S", "60")
+        return GeminiProvider(
+            api_key,
+            os.getenv("GEMINI_MODEL", DEFAULT_GEMINI_MODEL),
+            timeout=float(timeout) if timeout else None,
+        )
+
+    raise ValueError(f"Unknown LLM_BACKEND '{backend}'. Use 'gemini' or 'fake'.")
+
+
+def get_llm(backend=None):
+    """
+    Create the LLM client used by the web chat and the bot: the selected
+    provider behind deadlines, hedging and a circuit breaker, admitted by the
+    priority scheduler, with request coalescing in front so duplicates share
+    one call.
+
+    Returns:
+        LLMProvider instance, or None if the backend is not configured
+    """
+    from llm_coalesce import CoalescingProvider
+    from llm_resilience import from_env as resilient_from_env
+    from llm_scheduler import from_env as scheduled_from_env
+
+    provider = get_provider(backend)
+    if provider is None:
+        return None
+    return CoalescingProvider(scheduled_from_env(resilient_from_env(provider)))
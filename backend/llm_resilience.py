@@ -0,0 +1,356 @@
+"""
+Deadlines, hedged requests and a circuit breaker around the LLM backend.
+
+ResilientProvider runs each upstream call on a bounded worker pool so the
+calling thread (a Flask request or the Telegram polling loop) never waits
+longer than the deadline. If an attempt is slower than the recent latency
+percentile, one hedged duplicate is sent and the first reply wins. After
+repeated failures the circuit opens and calls fail fast with the last good
+reply for the same prompt, or LLMUnavailable so callers use their canned text.
+
+Settings (environment variables, all optional):
+    LLM_DEADLINE_S           per-call deadline in seconds (default 20)
+    LLM_HEDGE_PERCENTILE     latency percentile that triggers a hedge (default 95, 0 disables)
+    LLM_HEDGE_MIN_S          never hedge earlier than this (default 1.0)
+    LLM_MAX_INFLIGHT         upstream calls allowed at once (default 32)
+    LLM_BREAKER_FAILURES     consecutive failures that open the circuit (default 5)
+    LLM_BREAKER_COOLDOWN_S   seconds the circuit stays open (default 30)
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_coalesce import canonical_prompt_key
+from llm_provider import LLMError, LLMProvider
+
+
+class LLMTimeout(LLMError):
+    """Raised when the upstream call does not finish before its deadline."""
+
+
+class LLMUnavailable(LLMError):
+    """Raised when the call is rejected (circuit open or too many in flight)."""
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+
+    BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 60000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000.0
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if ms <= bound:
+                break
+        else:
+            i = len(self.BUCKETS_MS)
+        self.counts[i] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{b}" for b in self.BUCKETS_MS] + ["le_inf"]
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 1) if self.total else 0.0,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `cooldown` seconds, then lets a single trial call through.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    # allow() result for the call that holds the half-open trial
+    TRIAL = "trial"
+
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_inflight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Admit a call or reject it.
+
+        Returns:
+            False if rejected, TRIAL if this call took the half-open trial
+            (it must record an outcome or release_trial()), else True
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self.trial_inflight = False
+            if self.state == self.HALF_OPEN and not self.trial_inflight:
+                self.trial_inflight = True
+                return self.TRIAL
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_inflight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self.trial_inflight = False
+
+    def release_trial(self) -> None:
+        """
+        Give back a half-open trial that never reached the upstream (or was abandoned).
+
+        Only the call that allow() answered with TRIAL may call this.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.trial_inflight = False
+
+
+class ResilientProvider(LLMProvider):
+    """Wraps a provider with deadlines, hedging, load shedding and a breaker."""
+
+    OUTCOMES = ("ok", "hedged", "error", "timeout", "rejected", "cached")
+    CACHE_SIZE = 256
+    MIN_HEDGE_SAMPLES = 20
+
+    def __init__(self, inner: LLMProvider, deadline=20.0, hedge_percentile=95.0,
+                 hedge_min=1.0, max_inflight=32, breaker=None):
+        self.inner = inner
+        self.name = inner.name
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min = hedge_min
+        self.max_inflight = max_inflight
+        self.breaker = breaker or CircuitBreaker()
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._recent = deque(maxlen=200)
+        self._cache = OrderedDict()
+        self.histograms = {outcome: LatencyHistogram() for outcome in self.OUTCOMES}
+        self.hedges_sent = 0
+
+    # ---- helpers ----
+
+    def _hedge_delay(self):
+        if not self.hedge_percentile:
+            return None
+        with self._lock:
+            if len(self._recent) < self.MIN_HEDGE_SAMPLES:
+                return None
+            ordered = sorted(self._recent)
+        k = min(len(ordered) - 1, int(self.hedge_percentile / 100.0 * len(ordered)))
+        return max(self.hedge_min, ordered[k])
+
+    def _submit(self, fn, *args) -> bool:
+        with self._lock:
+            if self._inflight >= self.max_inflight:
+                return False
+            self._inflight += 1
+
+        def run():
+            try:
+                fn(*args)
+            finally:
+                with self._lock:
+                    self._inflight -= 1
+
+        self._executor.submit(run)
+        return True
+
+    def _attempt(self, prompt, results):
+        start = time.monotonic()
+        try:
+            text = self.inner.generate(prompt)
+            results.put((True, text, time.monotonic() - start))
+        except Exception as e:
+            results.put((False, e, time.monotonic() - start))
+
+    def _record(self, outcome, start):
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self.histograms[outcome].observe(elapsed)
+
+    def _remember(self, key, text):
+        with self._lock:
+            self._cache[key] = text
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _fallback(self, key, start, outcome, error):
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            self._record("cached", start)
+            return cached
+        self._record(outcome, start)
+        raise error
+
+    # ---- provider interface ----
+
+    def generate(self, prompt: str, **options) -> str:
+        key = canonical_prompt_key(prompt)
+        start = time.monotonic()
+
+        admitted = self.breaker.allow()
+        if not admitted:
+            return self._fallback(key, start, "rejected", LLMUnavailable("LLM circuit is open"))
+
+        results = queue.Queue()
+        if not self._submit(self._attempt, prompt, results):
+            # Shed before reaching the upstream: not a verdict on its health
+            if admitted == CircuitBreaker.TRIAL:
+                self.breaker.release_trial()
+            return self._fallback(key, start, "rejected", LLMUnavailable("Too many LLM calls in flight"))
+
+        deadline = start + self.deadline
+        hedge_delay = self._hedge_delay()
+        hedge_at = start + hedge_delay if hedge_delay is not None else None
+        attempts, failures, last_error = 1, 0, None
+
+        while True:
+            wait_until = deadline if hedge_at is None else min(deadline, hedge_at)
+            try:
+                ok, value, took = results.get(timeout=max(0.0, wait_until - time.monotonic()))
+            except queue.Empty:
+                if time.monotonic() >= deadline:
+                    self.breaker.record_failure()
+                    return self._fallback(key, start, "timeout", LLMTimeout(f"LLM call exceeded {self.deadline}s deadline"))
+                # Slower than the hedge percentile: send one duplicate, first reply wins
+                hedge_at = None
+                if self._submit(self._attempt, prompt, results):
+                    attempts += 1
+                    with self._lock:
+                        self.hedges_sent += 1
+                continue
+
+            if ok:
+                with self._lock:
+                    self._recent.append(took)
+                self.breaker.record_success()
+                self._remember(key, value)
+                self._record("hedged" if attempts > 1 else "ok", start)
+                return value
+
+            failures += 1
+            last_error = value
+            if failures >= attempts:
+                self.breaker.record_failure()
+                error = last_error if isinstance(last_error, LLMError) else LLMError(str(last_error))
+                return self._fallback(key, start, "error", error)
+
+    def stream(self, prompt: str, **options):
+        key = canonical_prompt_key(prompt)
+        start = time.monotonic()
+
+        admitted = self.breaker.allow()
+        if not admitted:
+            yield self._fallback(key, start, "rejected", LLMUnavailable("LLM circuit is open"))
+            return
+
+        chunks = queue.Queue()
+
+        def produce():
+            try:
+                for chunk in self.inner.stream(prompt):
+                    chunks.put((True, chunk))
+                chunks.put((True, None))
+            except Exception as e:
+                chunks.put((False, e))
+
+        # Until the breaker hears an outcome, a call holding the half-open
+        # trial must give it back if it is shed or its consumer stops reading
+        settled = False
+        try:
+            if not self._submit(produce):
+                yield self._fallback(key, start, "rejected", LLMUnavailable("Too many LLM calls in flight"))
+                return
+
+            deadline = start + self.deadline
+            parts = []
+            while True:
+                try:
+                    ok, value = chunks.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    settled = True
+                    self.breaker.record_failure()
+                    if parts:
+                        self._record("timeout", start)
+                        raise LLMTimeout(f"LLM stream exceeded {self.deadline}s deadline")
+                    yield self._fallback(key, start, "timeout", LLMTimeout(f"LLM stream exceeded {self.deadline}s deadline"))
+                    return
+
+                if not ok:
+                    settled = True
+                    self.breaker.record_failure()
+                    error = value if isinstance(value, LLMError) else LLMError(str(value))
+                    if parts:
+                        self._record("error", start)
+                        raise error
+                    yield self._fallback(key, start, "error", error)
+                    return
+
+                if value is None:
+                    settled = True
+                    self.breaker.record_success()
+                    self._remember(key, "".join(parts))
+                    self._record("ok", start)
+                    return
+
+                parts.append(value)
+                yield value
+        finally:
+            if not settled and admitted == CircuitBreaker.TRIAL:
+                self.breaker.release_trial()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "breaker": self.breaker.state,
+                "inflight_upstream": self._inflight,
+                "hedges_sent": self.hedges_sent,
+                "latency": {name: h.snapshot() for name, h in self.histograms.items()},
+            }
+
+
+def from_env(inner: LLMProvider) -> ResilientProvider:
+    """Build a ResilientProvider configured from environment variables."""
+    return ResilientProvider(
+        inner,
+        deadline=float(os.getenv("LLM_DEADLINE_S", "20")),
+        hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+        hedge_min=float(os.getenv("LLM_HEDGE_MIN_S", "1.0")),
+        max_inflight=int(os.getenv("LLM_MAX_INFLIGHT", "32")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30")),
+        ),
+    )
@@ -0,0 +1,225 @@
+"""
+Priority-aware fair scheduler for outbound LLM calls.
+
+Every LLM call passes through one admission gate shared by the process:
+
+- Priority classes: triage summaries go before follow-up chat, which goes
+  before free-text questions.
+- Fair queuing: inside a class, callers are served round-robin by flow key
+  (wallet address or Telegram chat id), so one chatty user cannot starve
+  the rest.
+- Global budget: a token bucket caps calls per minute (the API quota) and
+  a concurrency limit caps calls in flight.
+- Bounded waiting: a call that waits longer than its class allows is
+  rejected with LLMUnavailable so the caller falls back right away.
+
+Settings (environment variables, all optional):
+    LLM_RATE_PER_MIN       calls per minute across the process (default 0 = unlimited)
+    LLM_RATE_BURST         token bucket size (default rate/6, at least 1)
+    LLM_SCHED_CONCURRENCY  calls in flight at once (default 16)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from llm_provider import LLMProvider
+from llm_resilience import LLMUnavailable
+
+TRIAGE = 0
+FOLLOWUP = 1
+FREE_TEXT = 2
+
+PRIORITY_NAMES = {TRIAGE: "triage", FOLLOWUP: "followup", FREE_TEXT: "free_text"}
+
+
+class _Ticket:
+    __slots__ = ("granted", "enqueued_at", "priority", "flow", "cancelled")
+
+    def __init__(self, priority, flow):
+        self.granted = threading.Event()
+        self.enqueued_at = time.monotonic()
+        self.priority = priority
+        self.flow = flow
+        self.cancelled = False
+
+
+class TokenBucket:
+    """Refilling token bucket; rate <= 0 means unlimited."""
+
+    def __init__(self, rate_per_sec: float, burst: float):
+        self.rate = rate_per_sec
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> bool:
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def seconds_until_token(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+
+class LLMScheduler:
+    """Admission gate: decides which waiting call may go upstream next."""
+
+    # Longest a call may wait in the queue before it is rejected
+    MAX_WAIT_S = {TRIAGE: 15.0, FOLLOWUP: 10.0, FREE_TEXT: 5.0}
+
+    def __init__(self, rate_per_min=0.0, burst=None, concurrency=16, max_wait=None):
+        rate = float(rate_per_min) / 60.0
+        self.bucket = TokenBucket(rate, burst if burst else max(1.0, rate_per_min / 6.0))
+        self.concurrency = concurrency
+        self.max_wait = {**self.MAX_WAIT_S, **(max_wait or {})}
+        self._cond = threading.Condition()
+        # priority -> OrderedDict(flow -> deque of tickets); dict order is the round-robin
+        self._queues = {p: OrderedDict() for p in PRIORITY_NAMES}
+        self._depth = {p: 0 for p in PRIORITY_NAMES}
+        self._running = 0
+        self._stats = {p: {"dispatched": 0, "rejected": 0, "wait_total_s": 0.0, "wait_max_s": 0.0}
+                       for p in PRIORITY_NAMES}
+        threading.Thread(target=self._dispatch_loop, name="llm-scheduler", daemon=True).start()
+
+    # ---- caller side ----
+
+    def acquire(self, priority=FREE_TEXT, flow=None) -> None:
+        """Block until this call may go upstream; raise LLMUnavailable on timeout."""
+        priority = priority if priority in PRIORITY_NAMES else FREE_TEXT
+        ticket = _Ticket(priority, flow if flow is not None else "anonymous")
+
+        with self._cond:
+            self._queues[priority].setdefault(ticket.flow, deque()).append(ticket)
+            self._depth[priority] += 1
+            self._cond.notify_all()
+
+        if ticket.granted.wait(self.max_wait[priority]):
+            return
+
+        with self._cond:
+            # The dispatcher may have granted it just after the wait timed out
+            if ticket.granted.is_set():
+                return
+            ticket.cancelled = True
+            self._depth[priority] -= 1
+            self._stats[priority]["rejected"] += 1
+        raise LLMUnavailable(f"LLM queue wait exceeded for {PRIORITY_NAMES[priority]} call")
+
+    def release(self) -> None:
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    # ---- dispatcher ----
+
+    def _next_ticket(self):
+        for priority in sorted(self._queues):
+            flows = self._queues[priority]
+            while flows:
+                flow, tickets = next(iter(flows.items()))
+                ticket = tickets.popleft()
+                # Rotate this flow to the back so other callers get the next turn
+                del flows[flow]
+                if tickets:
+                    flows[flow] = tickets
+                if not ticket.cancelled:
+                    return ticket
+        return None
+
+    def _has_waiting(self):
+        return any(self._depth.values())
+
+    def _dispatch_loop(self):
+        with self._cond:
+            while True:
+                if not self._has_waiting() or self._running >= self.concurrency:
+                    self._cond.wait()
+                    continue
+                delay = self.bucket.seconds_until_token()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+
+                ticket = self._next_ticket()
+                if ticket is None:
+                    continue
+                # Spent only once a live ticket is picked; this thread is the
+                # bucket's only consumer, so the token checked above is still there
+                self.bucket.try_take()
+
+                waited = time.monotonic() - ticket.enqueued_at
+                stats = self._stats[ticket.priority]
+                stats["dispatched"] += 1
+                stats["wait_total_s"] += waited
+                stats["wait_max_s"] = max(stats["wait_max_s"], waited)
+                self._depth[ticket.priority] -= 1
+                self._running += 1
+                ticket.granted.set()
+
+    def stats(self) -> dict:
+        with self._cond:
+            classes = {}
+            for priority, name in PRIORITY_NAMES.items():
+                s = self._stats[priority]
+                classes[name] = {
+                    "queue_depth": self._depth[priority],
+                    "dispatched": s["dispatched"],
+                    "rejected": s["rejected"],
+                    "avg_wait_ms": round(1000.0 * s["wait_total_s"] / s["dispatched"], 1) if s["dispatched"] else 0.0,
+                    "max_wait_ms": round(1000.0 * s["wait_max_s"], 1),
+                }
+            return {"running": self._running, "classes": classes}
+
+
+class ScheduledProvider(LLMProvider):
+    """Wraps a provider so every call is admitted by an LLMScheduler."""
+
+    def __init__(self, inner: LLMProvider, scheduler: LLMScheduler):
+        self.inner = inner
+        self.name = inner.name
+        self.scheduler = scheduler
+
+    def generate(self, prompt: str, priority=FREE_TEXT, flow=None, **options) -> str:
+        self.scheduler.acquire(priority, flow)
+        try:
+            return self.inner.generate(prompt, **options)
+        finally:
+            self.scheduler.release()
+
+    def stream(self, prompt: str, priority=FREE_TEXT, flow=None, **options):
+        self.scheduler.acquire(priority, flow)
+        try:
+            yield from self.inner.stream(prompt, **options)
+        finally:
+            self.scheduler.release()
+
+    def stats(self) -> dict:
+        stats = {"scheduler": self.scheduler.stats()}
+        if hasattr(self.inner, "stats"):
+            stats.update(self.inner.stats())
+        return stats
+
+
+def from_env(inner: LLMProvider) -> ScheduledProvider:
+    """Build a ScheduledProvider configured from environment variables."""
+    rate = float(os.getenv("LLM_RATE_PER_MIN", "0"))
+    burst = os.getenv("LLM_RATE_BURST")
+    return ScheduledProvider(inner, LLMScheduler(
+        rate_per_min=rate,
+        burst=float(burst) if burst else None,
+        concurrency=int(os.getenv("LLM_SCHED_CONCURRENCY", "16")),
+    ))
@@ -0,0 +1,291 @@
+"""
+Startup schema migrations for the chat history database.
+
+Each migration runs once, in order, inside its own transaction. The applied
+version is tracked with SQLite's PRAGMA user_version, so existing databases
+created by older versions of app.py are upgraded in place on startup.
+
+To change the schema, append a new function to MIGRATIONS; never edit one
+that has already shipped.
+"""
+
+from archive import decompress_messages
+
+# Characters of the last message kept in conversations.last_message_preview
+PREVIEW_LENGTH = 120
+
+
+def _base_schema(c):
+    """Tables and indexes that app.py used to create inline (all IF NOT EXISTS)."""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            wallet_address TEXT NOT NULL,
+            title TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            wallet_address TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations(id)
+        )
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_wallet_address ON conversations(wallet_address)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_wallet ON messages(wallet_address)
+    ''')
+
+
+def _keyset_indexes(c):
+    """Composite indexes that serve the paginated history queries in index order."""
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_wallet_updated
+        ON conversations(wallet_address, updated_at, id)
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation_created
+        ON messages(conversation_id, created_at, id)
+    ''')
+    # Left prefix of idx_conversations_wallet_updated, so it only costs writes
+    c.execute('DROP INDEX IF EXISTS idx_wallet_address')
+
+
+def _message_search(c):
+    """
+    FTS5 index over message content, kept in sync with triggers.
+
+    wallet_address is indexed as a second column so a search can be scoped
+    with a column filter and FTS intersects the wallet's doclist with the
+    query terms instead of post-filtering matches from every wallet.
+    """
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content,
+            wallet_address,
+            content='messages',
+            content_rowid='id',
+            tokenize='porter unicode61'
+        )
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, content, wallet_address)
+            VALUES (new.id, new.content, new.wallet_address);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content, wallet_address)
+            VALUES ('delete', old.id, old.content, old.wallet_address);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, wallet_address ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content, wallet_address)
+            VALUES ('delete', old.id, old.content, old.wallet_address);
+            INSERT INTO messages_fts(rowid, content, wallet_address)
+            VALUES (new.id, new.content, new.wallet_address);
+        END
+    ''')
+    # Index messages stored before this migration
+    c.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+
+def _telegram_links(c):
+    """Telegram chat to wallet links (previously created inside the link handler)."""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS wallet_telegram_links (
+            telegram_user_id TEXT PRIMARY KEY,
+            wallet_address TEXT NOT NULL,
+            linked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _archive_table(c):
+    """Cold storage for old conversations: one row each, messages zlib-compressed."""
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archived_conversations (
+            id TEXT PRIMARY KEY,
+            wallet_address TEXT NOT NULL,
+            title TEXT,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            message_count INTEGER NOT NULL,
+            messages_blob BLOB NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_archived_wallet_updated
+        ON archived_conversations(wallet_address, updated_at, id)
+    ''')
+    # Lets the archival job find idle conversations without a table scan
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at)
+    ''')
+
+
+def _history_versions(c):
+    """
+    Per-wallet and per-conversation change counters for conditional GET.
+
+    Triggers bump them on every write that can change a history response,
+    so an ETag check reads one row instead of the message tables.
+    """
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS wallet_versions (
+            wallet_address TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_versions (
+            conversation_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+    bump = '''
+        INSERT INTO wallet_versions (wallet_address, version) VALUES ({row}.wallet_address, 1)
+        ON CONFLICT(wallet_address) DO UPDATE SET version = version + 1;
+        INSERT INTO conversation_versions (conversation_id, version) VALUES ({row}.{conversation}, 1)
+        ON CONFLICT(conversation_id) DO UPDATE SET version = version + 1;
+    '''
+    for table, conversation in (('messages', 'conversation_id'),
+                                ('conversations', 'id'),
+                                ('archived_conversations', 'id')):
+        for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+            c.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                    {bump.format(row=row, conversation=conversation)}
+                END
+            ''')
+
+
+def _conversation_summaries(c):
+    """
+    message_count, last_message_preview and last_role on each conversation,
+    so /chat/history can list them without touching messages.
+
+    Triggers on messages keep the hot table current; archived conversations
+    store the values they had when archived. Existing rows are backfilled.
+    """
+    for table in ('conversations', 'archived_conversations'):
+        columns = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+        if table == 'conversations' and 'message_count' not in columns:
+            c.execute('ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0')
+        if 'last_message_preview' not in columns:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN last_message_preview TEXT')
+        if 'last_role' not in columns:
+            c.execute(f'ALTER TABLE {table} ADD COLUMN last_role TEXT')
+
+    # Latest remaining message, by the same (created_at, id) order the
+    # conversation endpoint uses; served by idx_messages_conversation_created
+    latest = '''
+        (SELECT {column} FROM messages m
+         WHERE m.conversation_id = {conversation}
+         ORDER BY m.created_at DESC, m.id DESC LIMIT 1)
+    '''
+    preview = latest.format(column=f'substr(m.content, 1, {PREVIEW_LENGTH})', conversation='{conversation}')
+    role = latest.format(column='m.role', conversation='{conversation}')
+
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_summary_insert AFTER INSERT ON messages BEGIN
+            UPDATE conversations SET
+                message_count = message_count + 1,
+                last_message_preview = {preview.format(conversation='new.conversation_id')},
+                last_role = {role.format(conversation='new.conversation_id')}
+            WHERE id = new.conversation_id;
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_summary_delete AFTER DELETE ON messages BEGIN
+            UPDATE conversations SET
+                message_count = message_count - 1,
+                last_message_preview = {preview.format(conversation='old.conversation_id')},
+                last_role = {role.format(conversation='old.conversation_id')}
+            WHERE id = old.conversation_id;
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS messages_summary_update AFTER UPDATE OF content, role ON messages BEGIN
+            UPDATE conversations SET
+                last_message_preview = {preview.format(conversation='new.conversation_id')},
+                last_role = {role.format(conversation='new.conversation_id')}
+            WHERE id = new.conversation_id;
+        END
+    ''')
+
+    c.execute(f'''
+        UPDATE conversations SET
+            message_count = (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = conversations.id),
+            last_message_preview = {preview.format(conversation='conversations.id')},
+            last_role = {role.format(conversation='conversations.id')}
+    ''')
+
+    # Archived messages are only reachable through their compressed blob
+    archived = c.execute('SELECT id, messages_blob FROM archived_conversations').fetchall()
+    for conversation_id, blob in archived:
+        messages = decompress_messages(blob)
+        if messages:
+            _, last_role, content, _ = messages[-1]
+            c.execute('''
+                UPDATE archived_conversations SET last_message_preview = ?, last_role = ? WHERE id = ?
+            ''', (content[:PREVIEW_LENGTH], last_role, conversation_id))
+
+
+MIGRATIONS = [
+    _base_schema,
+    _keyset_indexes,
+    _message_search,
+    _telegram_links,
+    _archive_table,
+    _history_versions,
+    _conversation_summaries,
+]
+
+
+def migrate(db):
+    """
+    Bring the database schema up to date.
+
+    Args:
+        db: storage.Database to migrate
+
+    Returns:
+        int: Schema version after migrating
+    """
+    with db.connection() as conn:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        with db.connection() as conn:
+            # DDL does not open a transaction implicitly; take the write lock
+            # up front so the web app and the bot never migrate concurrently
+            conn.execute('BEGIN IMMEDIATE')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if number <= version:
+                continue
+            migration(conn.cursor())
+            # PRAGMA does not accept bound parameters
+            conn.execute(f'PRAGMA user_version = {number}')
+        print(f"Applied database migration {number}: {migration.__name__.strip('_')}")
+        version = number
+
+    with db.connection() as conn:
+        # Refresh planner statistics for any new indexes
+        conn.execute('PRAGMA optimize')
+    return version
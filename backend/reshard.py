@@ -0,0 +1,166 @@
+"""
+Offline tool to change the number of chat history shards.
+
+Copies every conversation, message, archived conversation and Telegram link
+from the current shard files into freshly migrated files for the new shard
+count, routing each row by wallet. The old files are kept with a .bak
+suffix. Stop app.py and script.py before running it, then start them with
+the new CHAT_DB_SHARDS.
+
+Messages get new ids in their target shard (ids are only unique per file).
+
+Usage:
+    python3 reshard.py --from-shards 1 --to-shards 4
+    python3 reshard.py --from-shards 4 --to-shards 1 --db /path/to/chat_history.db
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from sharding import ShardedStore, shard_index, shard_paths
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Rows copied per target transaction
+BATCH_SIZE = 5000
+
+
+def _copy_rows(source, targets, select_sql, insert_sql, wallet_column):
+    """Stream rows from one source shard into the target shard of each wallet."""
+    pending = [[] for _ in targets.shards]
+    copied = 0
+
+    def flush(i):
+        if pending[i]:
+            with targets.shards[i].db.connection() as conn:
+                conn.executemany(insert_sql, pending[i])
+            pending[i] = []
+
+    with source.db.connection() as conn:
+        for row in conn.execute(select_sql):
+            i = shard_index(row[wallet_column], targets.shard_count)
+            pending[i].append(row)
+            copied += 1
+            if len(pending[i]) >= BATCH_SIZE:
+                flush(i)
+    for i in range(len(targets.shards)):
+        flush(i)
+    return copied
+
+
+def reshard(base_path: str, from_shards: int, to_shards: int) -> dict:
+    """
+    Copy the chat history into to_shards files and swap them in.
+
+    Args:
+        base_path: Path of the unsharded database (chat_history.db)
+        from_shards: Current CHAT_DB_SHARDS
+        to_shards: New CHAT_DB_SHARDS
+
+    Returns:
+        dict: Row counts copied per table
+    """
+    old_paths = shard_paths(base_path, from_shards)
+    missing = [p for p in old_paths if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError(f"Missing shard files: {', '.join(missing)}")
+
+    staging_dir = tempfile.mkdtemp(prefix='reshard-', dir=os.path.dirname(os.path.abspath(base_path)))
+    staging_base = os.path.join(staging_dir, os.path.basename(base_path))
+
+    sources = ShardedStore(base_path, shard_count=from_shards, pool_size=1)
+    targets = ShardedStore(staging_base, shard_count=to_shards, pool_size=1)
+    counts = {"conversations": 0, "messages": 0, "archived_conversations": 0, "wallet_telegram_links": 0}
+
+    try:
+        for source in sources.shards:
+            counts["conversations"] += _copy_rows(source, targets, '''
+                SELECT id, wallet_address, title, created_at, updated_at FROM conversations
+            ''', '''
+                INSERT INTO conversations (id, wallet_address, title, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', 1)
+            # Insert in (created_at, id) order so new ids keep each conversation's order;
+            # the messages triggers rebuild each conversation's summary columns
+            counts["messages"] += _copy_rows(source, targets, '''
+                SELECT conversation_id, wallet_address, role, content, created_at
+                FROM messages ORDER BY created_at, id
+            ''', '''
+                INSERT INTO messages (conversation_id, wallet_address, role, content, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', 1)
+            counts["archived_conversations"] += _copy_rows(source, targets, '''
+                SELECT id, wallet_address, title, created_at, updated_at, message_count,
+                       messages_blob, archived_at, last_message_preview, last_role
+                FROM archived_conversations
+            ''', '''
+                INSERT INTO archived_conversations
+                    (id, wallet_address, title, created_at, updated_at, message_count,
+                     messages_blob, archived_at, last_message_preview, last_role)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', 1)
+            # Copying rows already bumped the target counters; adding the old
+            # values keeps every version above anything a client has cached
+            _copy_rows(source, targets, '''
+                SELECT wallet_address, version FROM wallet_versions
+            ''', '''
+                INSERT INTO wallet_versions (wallet_address, version) VALUES (?, ?)
+                ON CONFLICT(wallet_address) DO UPDATE SET version = version + excluded.version
+            ''', 0)
+            _copy_rows(source, targets, '''
+                SELECT v.conversation_id, v.version,
+                       COALESCE(c.wallet_address, a.wallet_address) AS wallet_address
+                FROM conversation_versions v
+                LEFT JOIN conversations c ON c.id = v.conversation_id
+                LEFT JOIN archived_conversations a ON a.id = v.conversation_id
+                WHERE COALESCE(c.wallet_address, a.wallet_address) IS NOT NULL
+            ''', '''
+                INSERT INTO conversation_versions (conversation_id, version)
+                SELECT ?1, ?2 WHERE ?3 IS NOT NULL
+                ON CONFLICT(conversation_id) DO UPDATE SET version = version + excluded.version
+            ''', 2)
+            counts["wallet_telegram_links"] += _copy_rows(source, targets, '''
+                SELECT telegram_user_id, wallet_address, linked_at FROM wallet_telegram_links
+            ''', '''
+                INSERT OR REPLACE INTO wallet_telegram_links (telegram_user_id, wallet_address, linked_at)
+                VALUES (?, ?, ?)
+            ''', 1)
+    finally:
+        sources.close()
+        targets.close()
+
+    # Closing the last connection checkpoints WAL into the main file, so only
+    # the database files themselves need to move
+    for path in old_paths:
+        os.replace(path, path + '.bak')
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    for staged, final in zip(shard_paths(staging_base, to_shards), shard_paths(base_path, to_shards)):
+        os.replace(staged, final)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Change the number of chat history shards")
+    parser.add_argument("--db", default=os.path.join(BASE_DIR, "chat_history.db"),
+                        help="Path of the unsharded database")
+    parser.add_argument("--from-shards", type=int, required=True, help="Current CHAT_DB_SHARDS")
+    parser.add_argument("--to-shards", type=int, required=True, help="New CHAT_DB_SHARDS")
+    args = parser.parse_args()
+
+    if args.from_shards == args.to_shards:
+        print("Shard count unchanged, nothing to do")
+        return
+
+    counts = reshard(args.db, args.from_shards, args.to_shards)
+    for table, count in counts.items():
+        print(f"{table:24} {count:>10} rows")
+    print(f"Resharded {args.from_shards} -> {args.to_shards}; set CHAT_DB_SHARDS={args.to_shards}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,22 @@
-import telebot
-from telebot import types
-from collections import Counter, defaultdict
-import google.generativeai as genai
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
-import requests
+import queue
 from dotenv import load_dotenv
+from llm_provider import get_llm
+from llm_scheduler import TRIAGE, FOLLOWUP, FREE_TEXT
+from triage_engine import more_urgent
+from bot_menus import MenuLoader
+from telegram_outbox import from_env as outbox_from_env
+from sharding import ShardedStore
+from chat_writer import ChatWriter
+from history_sync import TelegramHistorySync
+from update_dispatcher import OrderedTeleBot, from_env as update_executor_from_env
+from bot_sessions import from_env as session_store_from_env
+from bot_webhook import from_env as webhook_from_env
+from wound_model import IMG_SIZE, WoundClassifier
+from backend_client import BackendError, from_env as backend_client_from_env
 
 # Load environment variables from .env file (in parent directory)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -13,17 +24,20 @@ PARENT_DIR = os.path.dirname(BASE_DIR)
 load_dotenv(dotenv_path=os.path.join(PARENT_DIR, '.env'))
 
 # Get API keys from environment variables (DO NOT HARD CODE)
-GENAI_KEY = os.getenv("GEMINI_API_KEY")
-if not GENAI_KEY:
+# LLM_BACKEND=fake runs the bot against a local fake model (no key needed)
+llm = get_llm()
+if llm is None:
     raise ValueError("GEMINI_API_KEY environment variable is required. Create a .env file with GEMINI_API_KEY=your_key")
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN environment variable is required. Create a .env file with TELEGRAM_BOT_TOKEN=your_token")
 
-genai.configure(api_key=GENAI_KEY)
-model = genai.GenerativeModel("models/gemini-2.5-pro")
-bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
+# Updates run on a worker pool: in order within a chat, in parallel across chats
+update_executor = update_executor_from_env()
+bot = OrderedTeleBot(TELEGRAM_BOT_TOKEN, update_executor)
+# All outbound API calls: rate limited, 429-aware, deletes off the critical path
+outbox = outbox_from_env(bot)
 
 # Use parent directory for config files (they're in root)
 SYMPTOM_CONFIG_PATH = os.path.join(PARENT_DIR, "symptoms_config.Json")
@@ -38,48 +52,62 @@ except FileNotFoundError:
     print(f"Warning: {KEYWORD_PATH} not found. Health keyword filtering disabled.")
     HEALTH_KEYWORDS = []
 
-# Load symptom config
-with open(SYMPTOM_CONFIG_PATH, "r", encoding="utf-8") as f:
-    RAW_SYMPTOM_CONFIG = json.load(f)
-
-CATEGORY_CONFIG = RAW_SYMPTOM_CONFIG["categories"]
-SYMPTOM_CONFIG = RAW_SYMPTOM_CONFIG["symptoms"]
-
-SYMPTOMS = {name: cfg["label"] for name, cfg in SYMPTOM_CONFIG.items()}
-SYMPTOM_FLOWS = {
-    name: [
-        (step["field_id"], step["question"], step["options"])
-        for step in cfg.get("flow", [])
-    ]
-    for name, cfg in SYMPTOM_CONFIG.items()
-}
-
 with open(FACILITY_PATH, "r", encoding="utf-8") as f:
     FACILITY_DATA = json.load(f)
 
-user_symptoms: dict[int, Counter] = defaultdict(Counter)
-user_state: dict[int, dict] = {}
-
-last_bot_msg: dict[int, int] = {}
+# Keyboards, follow-up flows and the local rule-based triage engine, compiled
+# from the symptom config and recompiled when the file changes
+MENUS = MenuLoader(SYMPTOM_CONFIG_PATH, FACILITY_DATA)
+# How long Finish waits for the next streamed summary chunk (the first one
+# included) before answering from the local rules
+TRIAGE_LLM_BUDGET_S = float(os.getenv("TRIAGE_LLM_BUDGET_S", "12"))
+# One summary slot per update worker, so concurrent Finish presses never queue here
+summary_executor = ThreadPoolExecutor(max_workers=int(os.getenv("BOT_WORKERS", "16")), thread_name_prefix="summary")
+
+# Pooled keep-alive client for calls to the Flask backend (BACKEND_URL)
+backend = backend_client_from_env()
+
+# Chat history shared with the web app (same database files and CHAT_DB_SHARDS as app.py)
+DB_PATH = os.path.join(BASE_DIR, "chat_history.db")
+history_store = ShardedStore(
+    DB_PATH,
+    shard_count=int(os.getenv("CHAT_DB_SHARDS", "1")),
+    pool_size=2,
+    writer_factory=lambda db: ChatWriter(db, flush_interval=0.2)
+)
+history_sync = TelegramHistorySync(history_store)
+print(f"Loaded {history_sync.warm()} Telegram wallet links")
+
+# Per-chat symptoms, answers and menu state: bounded, idle-expiring, persisted
+sessions = session_store_from_env(BASE_DIR)
+
+# Wound photo classifier shared with the web app. Its single worker loads the
+# model on the first photo (TensorFlow + MobileNetV2 cost hundreds of MB, so
+# bot_cluster.py workers that never get a photo never pay for it), then runs
+# photo checks one at a time.
+wound_classifier = WoundClassifier.from_dir(BASE_DIR)
+wound_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wound")
+wound_load_attempted = False
+# How long a photo waits for its check (the first one may wait for the model to load)
+WOUND_BUDGET_S = float(os.getenv("WOUND_BUDGET_S", "30"))
+
+
+def check_wound(image_bytes) -> dict:
+    """Classify a wound photo, loading the model first if this is the first photo (wound worker only)."""
+    global wound_load_attempted
+    if not wound_load_attempted:
+        # Tried once: a missing or broken model is not reloaded for every photo
+        wound_load_attempted = True
+        wound_classifier.load()
+    return wound_classifier.predict(image_bytes)
 
 
 # ------------- STATE AND MESSAGE HELPERS -------------
 
-def get_state(chat_id: int) -> dict:
-    if chat_id not in user_state:
-        user_state[chat_id] = {
-            "details": {},
-            "current": None,   # current symptom
-            "category": None   # current system group
-        }
-    return user_state[chat_id]
-
 
 def safe_delete(chat_id: int, message_id: int) -> None:
-    try:
-        bot.delete_message(chat_id, message_id)
-    except Exception:
-        pass
+    """Delete a message in the background; never blocks or raises."""
+    outbox.delete(chat_id, message_id)
 
 
 def send_clean_message(chat_id: int, text: str, **kwargs):
@@ -88,25 +116,50 @@ def send_clean_message(chat_id: int, text: str, **kwargs):
     used for questions and short prompts. Do not use for messages that
     carry the main reply keyboard or for final AI results.
     """
-    old_id = last_bot_msg.get(chat_id)
-    if old_id is not None:
-        safe_delete(chat_id, old_id)
+    session = sessions.get(chat_id)
+    if session.last_bot_msg is not None:
+        safe_delete(chat_id, session.last_bot_msg)
 
-    msg = bot.send_message(chat_id, text, **kwargs)
-    last_bot_msg[chat_id] = msg.message_id
+    msg = outbox.send(chat_id, text, **kwargs)
+    session.last_bot_msg = msg.message_id
     return msg
 
 
+def confirm_wallet_link(chat_id: int, message_id: int, wallet_address: str, future) -> None:
+    """Turn the "Linking your wallet..." message into the backend's answer."""
+    try:
+        future.result()
+    except Exception as e:
+        print(f"Error linking wallet: {e}")
+        if isinstance(e, BackendError) and e.status == 401:
+            print("The backend rejected the bot's credential; check BOT_API_SECRET in .env")
+        outbox.edit_later(chat_id, message_id, "Failed to link wallet. Please try again later.")
+        return
+
+    history_sync.link(chat_id, wallet_address)
+    outbox.edit_later(
+        chat_id,
+        message_id,
+        f"✅ Wallet linked successfully!\n\n"
+        f"Address: {wallet_address}\n\n"
+        f"Your chat history will now sync across Telegram and the web app."
+    )
+
+
 # ------------- AI FUNCTIONS -------------
 
-def medlm_summary(symptoms, details):
-    prompt = f"""
+def describe_wound(wound) -> str:
+    return f"Wound photo check: {wound['label']} ({wound['confidence']:.0%} confidence)"
+
+
+def summary_prompt(symptoms, details, wound=None) -> str:
+    photo = f"\n{describe_wound(wound)}, from an automatic image check that may be wrong" if wound else ""
+    return f"""
 User symptoms: {symptoms}
-Symptom details: {details}
+Symptom details: {details}{photo}
 
 Provide a concise, safe triage summary:
-- possible explanations (NOT a diagnosis)
-- write EXACTLY one line starting with:
+- start with EXACTLY one line, the first line, that is one of:
   Severity: self-care
   OR
   Severity: urgent care
@@ -116,17 +169,36 @@ Provide a concise, safe triage summary:
   Severity: Trauma center
   OR
   Severity: Appointment with provider
+- possible explanations (NOT a diagnosis)
 - red flags to watch for
 - under 70 words
 - no medications
 - do not use any "*" when answering
 - use common words, less medical terms, make it very easy to comprehend
 """
-    try:
-        response = model.generate_content(prompt)
-        return (response.text or "").strip()
-    except Exception:
-        return "I could not create a summary."
+
+
+def medlm_summary_stream(symptoms, details, wound=None, chat_id=None) -> queue.Queue:
+    """
+    Generate the triage summary on a summary worker, chunk by chunk.
+
+    Returns:
+        queue.Queue: Receives text chunks as the model streams them, then
+        None when the stream ends or the exception if it fails
+    """
+    chunks = queue.Queue()
+
+    def produce():
+        try:
+            for chunk in llm.stream(summary_prompt(symptoms, details, wound), priority=TRIAGE, flow=chat_id):
+                chunks.put(chunk)
+            chunks.put(None)
+        except Exception as e:
+            print(f"Triage summary stream failed for chat {chat_id}: {e}")
+            chunks.put(e)
+
+    summary_executor.submit(produce)
+    return chunks
 
 
 def is_relevant_text(text: str, counts: Counter) -> bool:
@@ -144,20 +216,21 @@ def is_relevant_text(text: str, counts: Counter) -> bool:
         return True
 
     # check if the text mentions any known symptom
-    if any(sym.lower() in t for sym in SYMPTOMS.keys()):
+    if any(sym in t for sym in MENUS.current().symptom_words):
         return True
 
     return False
 
 
-def gemini_chat_reply(user_text, counts=None, details=None):
+def gemini_chat_reply(user_text, counts=None, details=None, chat_id=None, wound=None):
     counts = counts or Counter()
     details = details or {}
+    photo = f"\n{describe_wound(wound)}" if wound else ""
 
     prompt = f"""
 Context:
 Symptoms selected: {list(counts.elements())}
-Details: {details}
+Details: {details}{photo}
 
 User message: "{user_text}"
 
@@ -167,26 +240,30 @@ Use simple language.
 You may remind the user that this is not medical advice.
 """
 
+    # questions about selected symptoms are follow-ups; anything else is free text
+    priority = FOLLOWUP if sum(counts.values()) > 0 else FREE_TEXT
     try:
-        resp = model.generate_content(prompt)
-        return (resp.text or "").strip() or "I could not respond."
+        return llm.generate(prompt, priority=priority, flow=chat_id).strip() or "I could not respond."
     except Exception:
         return "I could not respond."
 
 
+def find_severity(summary: str):
+    """Lowercased value of the first "Severity:" line, or None if there is none."""
+    for raw in summary.splitlines():
+        line = raw.strip()
+        if line.lower().startswith("severity:"):
+            return line.split(":", 1)[1].strip().lower()
+    return None
+
+
 def extract_urgency_from_summary(summary: str) -> str:
     """
     Map Severity line to one of:
     "urgent", "er", "trauma", "appointment", "".
     """
 
-    severity_value = ""
-
-    for raw in summary.splitlines():
-        line = raw.strip()
-        if line.lower().startswith("severity:"):
-            severity_value = line.split(":", 1)[1].strip().lower()
-            break
+    severity_value = find_severity(summary)
 
     if not severity_value:
         return ""
@@ -211,6 +288,22 @@ def extract_urgency_from_summary(summary: str) -> str:
     return ""
 
 
+def describe_symptoms(symptoms, details, wound=None) -> str:
+    """Readable record of the selected symptoms and answers for chat history."""
+    lines = []
+    for symptom in dict.fromkeys(list(symptoms) + list(details.keys())):
+        answers = details.get(symptom, {})
+        if answers:
+            answered = ", ".join(f"{field}: {value}" for field, value in answers.items())
+            lines.append(f"{symptom} ({answered})")
+        else:
+            lines.append(symptom)
+    text = "Symptoms: " + ("; ".join(lines) if lines else "none selected")
+    if wound:
+        text += "\n" + describe_wound(wound)
+    return text
+
+
 # ------------- FACILITIES -------------
 
 def build_facility_message(category: str) -> str:
@@ -238,44 +331,92 @@ def build_facility_message(category: str) -> str:
     body = "\n".join(lines)
     return header + body + "\n\nIf you ever feel in danger, call 911."
 
-# ------------- FOLLOW UP QUESTIONS -------------
+# ------------- TRIAGE SUMMARY -------------
 
-def ask_next_detail(chat_id: int, symptom: str) -> None:
-    state = get_state(chat_id)
-    details = state["details"].setdefault(symptom, {})
+def send_facility_message(chat_id: int, summary: str, local) -> str:
+    """Send facilities for the summary's severity, never less urgent than the local rules."""
+    category = more_urgent(extract_urgency_from_summary(summary), local.category)
+    facility_msg = build_facility_message(category)
+    if facility_msg:
+        outbox.send_later(chat_id, facility_msg)
+    return facility_msg
 
-    flow = SYMPTOM_FLOWS.get(symptom, [])
 
-    if not flow:
-        user_symptoms[chat_id][symptom] += 1
+def stream_triage_summary(chat_id: int, symptoms, details, local):
+    """
+    Stream the LLM triage summary into one message that is edited as it grows.
+
+    The message first shows the local rule-based result. The facility
+    message goes out as soon as the summary's Severity line is complete,
+    not after the whole reply. If the model sends nothing for
+    TRIAGE_LLM_BUDGET_S or the stream fails, the local result is the answer.
+
+    Returns:
+        tuple: (final summary text, facility message or "")
+    """
+    session = sessions.get(chat_id)
+    if session.last_bot_msg is not None:
+        safe_delete(chat_id, session.last_bot_msg)
+        session.last_bot_msg = None
+    live = outbox.live(chat_id, f"{local.to_text()}\n\nThinking about a detailed summary...")
+
+    chunks = medlm_summary_stream(symptoms, details, session.wound, chat_id=chat_id)
+    text = ""
+    facility_msg = None
+    while True:
+        try:
+            chunk = chunks.get(timeout=TRIAGE_LLM_BUDGET_S)
+        except queue.Empty:
+            print(f"Triage summary for chat {chat_id} stalled, answering from local rules")
+            chunk = None
+            text = ""
+        if chunk is None:
+            break
+        if isinstance(chunk, Exception):
+            # LLM down: the local rules are the full answer
+            text = ""
+            break
+        text += chunk
+        live.update(text.strip())
+        if facility_msg is None:
+            complete = text[:text.rfind("\n") + 1]
+            if find_severity(complete) is not None:
+                facility_msg = send_facility_message(chat_id, complete, local)
+
+    ai_text = text.strip() or local.to_text()
+    # final text should stay
+    live.finish(ai_text)
+    if facility_msg is None:
+        facility_msg = send_facility_message(chat_id, text, local)
+    return ai_text, facility_msg
+
+
+# ------------- FOLLOW UP QUESTIONS -------------
+
+def ask_next_detail(chat_id: int, symptom: str, answered: str = None) -> None:
+    session = sessions.get(chat_id)
+    details = session.details.setdefault(symptom, {})
+
+    menus = MENUS.current()
+    if not menus.flows.get(symptom):
+        session.symptoms[symptom] += 1
         send_clean_message(chat_id, f"Saved {symptom}. You can select another symptom or press Finish.")
-        state["current"] = None
+        session.current = None
         return
 
-    answered = set(details.keys())
-    next_step = None
-    for field_id, question, options in flow:
-        if field_id not in answered:
-            next_step = (field_id, question, options)
-            break
+    next_step = menus.next_step(symptom, details, answered)
 
-    if not next_step:
-        user_symptoms[chat_id][symptom] += 1
+    if next_step is None:
+        session.symptoms[symptom] += 1
         send_clean_message(
             chat_id,
             f"Saved {symptom}. Choose another symptom or press Finish."
         )
-        state["current"] = None
+        session.current = None
         return
 
-    field_id, question, options = next_step
-    keyboard = types.InlineKeyboardMarkup()
-    for label, value in options:
-        cb_data = f"detail|{symptom}|{field_id}|{value}"
-        keyboard.add(types.InlineKeyboardButton(label, callback_data=cb_data))
-
-    state["current"] = symptom
-    send_clean_message(chat_id, question, reply_markup=keyboard)
+    session.current = symptom
+    send_clean_message(chat_id, next_step.question, reply_markup=next_step.keyboard)
 
 
 @bot.callback_query_handler(func=lambda c: c.data.startswith("detail|"))
@@ -283,17 +424,16 @@ def handle_detail_callback(call):
     chat_id = call.message.chat.id
     parts = call.data.split("|")
     if len(parts) != 4:
-        bot.answer_callback_query(call.id)
+        outbox.answer_callback(call.id)
         return
 
     _, symptom, field_id, value = parts
 
-    state = get_state(chat_id)
-    details = state["details"].setdefault(symptom, {})
+    details = sessions.get(chat_id).details.setdefault(symptom, {})
     details[field_id] = value
 
-    bot.answer_callback_query(call.id)
-    ask_next_detail(chat_id, symptom)
+    outbox.answer_callback(call.id)
+    ask_next_detail(chat_id, symptom, answered=field_id)
 
 
 # ------------- SYSTEM -> SYMPTOM DROPDOWN -------------
@@ -304,25 +444,23 @@ def handle_symptom_category_callback(call):
     data = call.data
 
     if data == "symcat_back":
-        state = get_state(chat_id)
-        state["category"] = None
+        sessions.get(chat_id).category = None
         # remove dropdown message only
         safe_delete(chat_id, call.message.message_id)
-        bot.answer_callback_query(call.id)
+        outbox.answer_callback(call.id)
         return
 
     # symptom from dropdown
     _, symptom_name = data.split("|", 1)
     symptom_name = symptom_name.strip()
 
-    if symptom_name in SYMPTOMS:
-        bot.answer_callback_query(call.id)
-        state = get_state(chat_id)
-        state["current"] = symptom_name
+    if symptom_name in MENUS.current().symptoms:
+        outbox.answer_callback(call.id)
+        sessions.get(chat_id).current = symptom_name
         # go straight to follow up questions
         ask_next_detail(chat_id, symptom_name)
     else:
-        bot.answer_callback_query(call.id, text="Unknown symptom")
+        outbox.answer_callback(call.id, text="Unknown symptom")
 
 
 # ------------- COMMAND HANDLERS -------------
@@ -331,31 +469,13 @@ def handle_symptom_category_callback(call):
 def start(message):
     chat_id = message.chat.id
 
-    systems = list(CATEGORY_CONFIG.keys())
-
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-
-    # 2 systems per row
-    row = []
-    for i, name in enumerate(systems, start=1):
-        row.append(types.KeyboardButton(name))
-        if i % 2 == 0:
-            markup.add(*row)
-            row = []
-    if row:
-        markup.add(*row)
-
-    # last row is Finish
-    markup.add(types.KeyboardButton("Finish"))
+    sessions.reset(chat_id)
+    history_sync.end_session(chat_id)
 
-    user_symptoms[chat_id].clear()
-    user_state.pop(chat_id, None)
-    last_bot_msg.pop(chat_id, None)
-
-    bot.send_message(
+    outbox.send_later(
         chat_id,
         f"Hello {message.from_user.first_name}\nFirst choose a body system in the bottom menu. Then pick symptoms. Press Finish when done.",
-        reply_markup=markup,
+        reply_markup=MENUS.current().start_keyboard,
     )
 
     safe_delete(chat_id, message.message_id)
@@ -368,15 +488,15 @@ def help_or_reset_or_link(message):
     if message.text == "/help":
         send_clean_message(
             chat_id,
-            "This tool helps you think about symptom urgency. It does not give a medical diagnosis. Use /start to begin."
+            "This tool helps you think about symptom urgency. It does not give a medical diagnosis. Use /start to begin. "
+            "You can also send a photo of a wound to include an automatic photo check in your summary."
         )
         safe_delete(chat_id, message.message_id)
         return
 
     if message.text == "/reset":
-        user_symptoms[chat_id].clear()
-        user_state.pop(chat_id, None)
-        last_bot_msg.pop(chat_id, None)
+        sessions.reset(chat_id)
+        history_sync.end_session(chat_id)
         send_clean_message(chat_id, "Reset complete. Use /start to begin again.")
         safe_delete(chat_id, message.message_id)
         return
@@ -394,34 +514,69 @@ def help_or_reset_or_link(message):
         return
 
 
+# ------------- WOUND PHOTOS -------------
+
+def pick_photo_size(photo_sizes, min_side=min(IMG_SIZE)):
+    """Smallest Telegram photo size that still covers the model input, else the largest."""
+    covering = [p for p in photo_sizes if min(p.width, p.height) >= min_side]
+    if covering:
+        return min(covering, key=lambda p: p.width * p.height)
+    return max(photo_sizes, key=lambda p: p.width * p.height)
+
+
+@bot.message_handler(content_types=["photo"])
+def handle_photo(message):
+    chat_id = message.chat.id
+    photo = pick_photo_size(message.photo)
+
+    checking = outbox.send(chat_id, "Checking your photo...")
+    try:
+        image_bytes = bot.download_file(bot.get_file(photo.file_id).file_path)
+        # Inference runs on the wound worker, decoded in memory
+        result = wound_executor.submit(check_wound, image_bytes).result(timeout=WOUND_BUDGET_S)
+    except Exception as e:
+        print(f"Wound photo check failed for chat {chat_id}: {e}")
+        result = None
+    finally:
+        safe_delete(chat_id, checking.message_id)
+
+    if result is None:
+        if wound_classifier.loaded or not wound_load_attempted:
+            reply = "I could not check that photo. Please try again with a clear, close photo of the wound."
+        else:
+            reply = "Photo checks are not available right now. You can still describe your symptoms."
+        send_clean_message(chat_id, reply)
+        return
+
+    wound = {"label": result["predicted_class"], "confidence": round(result["confidence"], 3)}
+    sessions.get(chat_id).wound = wound
+
+    # keep photo results, like AI chat replies
+    reply = (
+        f"Photo check: this looks most like {wound['label']} ({wound['confidence']:.0%} confidence).\n"
+        "This is an automatic check, not a diagnosis. It will be part of your summary when you press Finish."
+    )
+    outbox.send_later(chat_id, reply)
+
+    history_sync.record(chat_id, [("user", "[Wound photo]"), ("assistant", reply)])
+
+
 # ------------- MAIN MESSAGE HANDLER -------------
 
 @bot.message_handler(func=lambda msg: True)
 def handle_message(message):
     chat_id = message.chat.id
     text = message.text
+    menus = MENUS.current()
 
     # system selected from bottom menu
-    if text in CATEGORY_CONFIG:
-        state = get_state(chat_id)
-        state["category"] = text
-
-        keyboard = types.InlineKeyboardMarkup()
-        symptom_names = CATEGORY_CONFIG[text]
-
-        for i in range(0, len(symptom_names), 2):
-            row = []
-            for name in symptom_names[i:i + 2]:
-                cb_data = f"symcat|{name}"
-                row.append(types.InlineKeyboardButton(name, callback_data=cb_data))
-            keyboard.row(*row)
-
-        keyboard.add(types.InlineKeyboardButton("Back", callback_data="symcat_back"))
+    if text in menus.category_keyboards:
+        sessions.get(chat_id).category = text
 
         send_clean_message(
             chat_id,
-            f"{text}: choose a symptom below.",
-            reply_markup=keyboard,
+            menus.category_prompts[text],
+            reply_markup=menus.category_keyboards[text],
         )
 
         safe_delete(chat_id, message.message_id)
@@ -429,30 +584,24 @@ def handle_message(message):
 
     # finish pressed
     if text in ("Finish", "/finish", "/Finish"):
-        counts = user_symptoms[chat_id]
-        details = user_state.get(chat_id, {}).get("details", {})
+        session = sessions.get(chat_id)
+        counts = session.symptoms
+        details = session.details
 
-        thinking_msg = send_clean_message(chat_id, "Thinking...")
+        symptoms = list(counts.elements())
+        local = menus.triage_engine.triage(symptoms, details)
 
-        try:
-            ai_text = medlm_summary(
-                symptoms=list(counts.elements()),
-                details=details
-            )
-        finally:
-            safe_delete(chat_id, thinking_msg.message_id)
-
-        # final text should stay
-        bot.send_message(chat_id, ai_text)
-
-        category = extract_urgency_from_summary(ai_text)
-        facility_msg = build_facility_message(category)
+        # local result right away, then the LLM summary streamed over it
+        ai_text, facility_msg = stream_triage_summary(chat_id, symptoms, details, local)
+
+        # sync the finished triage session to the linked wallet's history
+        synced = [("user", describe_symptoms(symptoms, details, session.wound)), ("assistant", ai_text)]
         if facility_msg:
-            bot.send_message(chat_id, facility_msg)
+            synced.append(("assistant", facility_msg))
+        history_sync.record(chat_id, synced, title="Triage: " + ", ".join(dict.fromkeys(symptoms)))
+        history_sync.end_session(chat_id)
 
-        user_symptoms[chat_id].clear()
-        user_state.pop(chat_id, None)
-        last_bot_msg.pop(chat_id, None)
+        sessions.reset(chat_id)
 
         safe_delete(chat_id, message.message_id)
         return
@@ -467,59 +616,60 @@ def handle_message(message):
             safe_delete(chat_id, message.message_id)
             return
         
-        # Link wallet to Telegram user ID via backend API
-        try:
-            backend_url = os.getenv("BACKEND_URL", "http://localhost:5001")
-            response = requests.post(
-                f"{backend_url}/wallet/link-telegram",
-                json={
-                    "telegram_user_id": str(chat_id),
-                    "wallet_address": wallet_address,
-                    "signature": ""  # In production, require signature verification
-                },
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                send_clean_message(
-                    chat_id,
-                    f"✅ Wallet linked successfully!\n\n"
-                    f"Address: {wallet_address}\n\n"
-                    f"Your chat history will now sync across Telegram and the web app."
-                )
-            else:
-                send_clean_message(chat_id, "Failed to link wallet. Please try again later.")
-        except Exception as e:
-            print(f"Error linking wallet: {e}")
-            send_clean_message(chat_id, "Failed to link wallet. Please try again later.")
-        
+        # Acknowledge now; the backend's answer edits this message
+        ack = send_clean_message(chat_id, "Linking your wallet...")
+        future = backend.link_telegram(chat_id, wallet_address)
+        future.add_done_callback(lambda f: confirm_wallet_link(chat_id, ack.message_id, wallet_address, f))
+
         safe_delete(chat_id, message.message_id)
         return
 
     # user typed a symptom name directly
-    if text in SYMPTOMS:
-        state = get_state(chat_id)
-        state["current"] = text
+    if text in menus.symptoms:
+        sessions.get(chat_id).current = text
         ask_next_detail(chat_id, text)
         safe_delete(chat_id, message.message_id)
         return
 
     # free text -> Gemini (with guardrails)
-    counts = user_symptoms[chat_id]
-    details = user_state.get(chat_id, {}).get("details", {})
+    session = sessions.get(chat_id)
+    counts = session.symptoms
+    details = session.details
 
     # if message is not health-related and no symptoms selected, ignore it
     if not is_relevant_text(text, counts):
         return
 
-    thinking = bot.send_message(chat_id, "Thinking...")
+    thinking = outbox.send(chat_id, "Thinking...")
     try:
-        reply = gemini_chat_reply(text, counts, details)
+        reply = gemini_chat_reply(text, counts, details, chat_id=chat_id, wound=session.wound)
     finally:
         safe_delete(chat_id, thinking.message_id)
 
     # keep AI chat replies
-    bot.send_message(chat_id, reply)
-
-
-bot.infinity_polling()
+    outbox.send_later(chat_id, reply)
+
+    history_sync.record(chat_id, [("user", text), ("assistant", reply)])
+
+
+def shutdown() -> None:
+    """Finish queued updates and replies, then persist sessions and history."""
+    update_executor.shutdown(wait=True)
+    # Pending backend calls may still edit messages through the outbox
+    backend.close()
+    outbox.close()
+    summary_executor.shutdown(wait=False)
+    wound_executor.shutdown(wait=False)
+    sessions.close()
+    history_store.close()
+
+
+if __name__ == "__main__":
+    # BOT_WEBHOOK_URL switches from long polling to the webhook receiver;
+    # bot_cluster.py runs this module's handlers in several worker processes
+    webhook = webhook_from_env(bot)
+    if webhook is not None:
+        print(f"Receiving updates by webhook on port {webhook.port}")
+        webhook.serve_forever()
+    else:
+        bot.infinity_polling()
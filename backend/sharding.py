@@ -0,0 +1,86 @@
+"""
+Wallet-sharded SQLite storage.
+
+SQLite allows one writer per database file, which caps chat write
+throughput no matter how many workers run. In sharded mode each wallet is
+hashed to one of N database files, and every shard has its own connection
+pool and background writer, so writes to different shards proceed in
+parallel. All data for a wallet (conversations, messages, archive, Telegram
+links) lives in its shard, so every history endpoint touches one file.
+
+CHAT_DB_SHARDS=1 (the default) keeps the single chat_history.db file.
+Change the shard count only with the offline reshard.py tool.
+"""
+
+import os
+import zlib
+
+from migrations import migrate
+from storage import Database
+
+
+def shard_paths(base_path: str, shard_count: int):
+    """Database files for a shard count; one shard keeps the original file name."""
+    if shard_count <= 1:
+        return [base_path]
+    root, ext = os.path.splitext(base_path)
+    return [f"{root}.shard{i}of{shard_count}{ext}" for i in range(shard_count)]
+
+
+def shard_index(wallet_address: str, shard_count: int) -> int:
+    """Stable wallet -> shard mapping (same result in every process)."""
+    if shard_count <= 1:
+        return 0
+    return zlib.crc32(wallet_address.lower().encode('utf-8')) % shard_count
+
+
+class Shard:
+    __slots__ = ("index", "path", "db", "writer")
+
+    def __init__(self, index, path, db, writer):
+        self.index = index
+        self.path = path
+        self.db = db
+        self.writer = writer
+
+
+class ShardedStore:
+    """Routes each wallet to its shard's Database and ChatWriter."""
+
+    def __init__(self, base_path: str, shard_count: int = 1, pool_size: int = 8, writer_factory=None):
+        """
+        Args:
+            base_path: Path of the unsharded database (e.g. chat_history.db)
+            shard_count: Number of database files
+            pool_size: Connections per shard
+            writer_factory: Callable(db) -> ChatWriter, or None for read-only use
+        """
+        self.shard_count = max(1, shard_count)
+        self.shards = []
+        for i, path in enumerate(shard_paths(base_path, self.shard_count)):
+            db = Database(path, pool_size=pool_size)
+            migrate(db)
+            writer = writer_factory(db) if writer_factory else None
+            self.shards.append(Shard(i, path, db, writer))
+
+    def shard_for(self, wallet_address: str) -> Shard:
+        return self.shards[shard_index(wallet_address, self.shard_count)]
+
+    def db_for(self, wallet_address: str) -> Database:
+        return self.shard_for(wallet_address).db
+
+    def writer_for(self, wallet_address: str):
+        return self.shard_for(wallet_address).writer
+
+    def stats(self) -> list:
+        return [
+            dict(shard=s.index, **(s.writer.stats() if s.writer else {}))
+            for s in self.shards
+        ]
+
+    def close(self) -> None:
+        """Drain every shard's writer and close idle connections."""
+        for s in self.shards:
+            if s.writer:
+                s.writer.close()
+            s.db.close_all()
@@ -0,0 +1,126 @@
+"""
+SQLite storage layer for chat history.
+
+Connections are pooled and reused across requests instead of opening a new
+one per handler. Every connection runs in WAL mode with tuned pragmas and a
+busy timeout, so readers do not block on writers and short write bursts
+wait instead of failing with "database is locked".
+
+Usage:
+    db = Database(DB_PATH)
+    with db.connection() as conn:
+        conn.execute("INSERT ...", params)
+    # committed on success, rolled back on exception, always returned to the pool
+"""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    # WAL + NORMAL is durable against application crashes; only an OS crash
+    # or power loss can drop the most recent commits
+    "synchronous": "NORMAL",
+    "cache_size": -20000,       # ~20 MB page cache per connection
+    "mmap_size": 268435456,     # 256 MB memory-mapped reads
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,       # ms to wait for the write lock
+}
+
+
+class Database:
+    """Bounded pool of SQLite connections to one database file."""
+
+    def __init__(self, path: str, pool_size: int = 8, pragmas: dict = None,
+                 cached_statements: int = 256):
+        self.path = path
+        self.pool_size = pool_size
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.pragmas["busy_timeout"] / 1000.0,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.pool_size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def _checkin(self, conn: sqlite3.Connection, broken: bool = False) -> None:
+        if broken:
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a pooled connection for one unit of work.
+
+        Commits when the block exits normally and rolls back if it raises.
+        The connection is always returned to the pool.
+        """
+        conn = self._checkout()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except sqlite3.Error as e:
+            broken = isinstance(e, (sqlite3.InterfaceError, sqlite3.ProgrammingError))
+            self._safe_rollback(conn)
+            raise
+        except BaseException:
+            self._safe_rollback(conn)
+            raise
+        finally:
+            self._checkin(conn, broken)
+
+    @staticmethod
+    def _safe_rollback(conn):
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    def close_all(self) -> None:
+        """Close idle connections (used on shutdown and in benchmarks)."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self._created -= 1
+            conn.close()
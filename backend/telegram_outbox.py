@@ -0,0 +1,250 @@
+"""
+Outbound Telegram API scheduler for the bot.
+
+Every call the bot makes to Telegram goes through here instead of straight
+to TeleBot:
+
+- Sends are rate limited by a global token bucket and one bucket per chat,
+  kept under Telegram's flood limits (about 30 messages/s overall and
+  about 1/s sustained per chat) so calls are not rejected with 429.
+- A 429 that still gets through is retried after its retry_after. Until
+  then every other send waits too, because the limit is per bot.
+- Sends to one chat keep their order, and sends to different chats run in
+  parallel. send() waits for the message (callers need its id);
+  send_later() queues it behind the chat's earlier sends and returns
+  immediately.
+- Deletes and callback answers are fire-and-forget on a separate pool, so
+  they never delay the user's next message. They still take a token from
+  the global bucket, wait out a 429 pause and start one on their own 429.
+- live() sends a message that is then edited in place as its text grows
+  (streamed LLM replies). Edits go through the same per-chat queue and
+  buckets, at most one per TG_EDIT_INTERVAL_S; intermediate texts are
+  skipped, never queued.
+
+Settings (environment variables, all optional):
+    TG_GLOBAL_RATE   messages per second across all chats (default 25)
+    TG_CHAT_RATE     sustained messages per second per chat (default 1)
+    TG_CHAT_BURST    messages a chat may burst before TG_CHAT_RATE applies (default 5)
+    TG_SEND_WORKERS  concurrent send threads (default 8)
+    TG_EDIT_INTERVAL_S  minimum seconds between edits of a live message (default 1)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+
+from llm_scheduler import TokenBucket
+from update_dispatcher import KeyedExecutor
+
+# Per-chat buckets kept for the most recently active chats
+MAX_CHAT_BUCKETS = 10000
+
+
+def not_modified(error) -> bool:
+    """True if Telegram rejected an edit because the text did not change."""
+    return (isinstance(error, ApiTelegramException) and error.error_code == 400
+            and "not modified" in str((error.result_json or {}).get("description", "")))
+
+
+def retry_after(error) -> float:
+    """Seconds Telegram asked us to wait, or None if the error is not a 429."""
+    if not isinstance(error, ApiTelegramException) or error.error_code != 429:
+        return None
+    params = (error.result_json or {}).get("parameters") or {}
+    return float(params.get("retry_after", 1))
+
+
+class TelegramOutbox:
+    """Rate-limited, per-chat ordered sender with fire-and-forget cleanup calls."""
+
+    def __init__(self, bot, global_rate=25.0, chat_rate=1.0, chat_burst=5.0, workers=8, max_retries=3,
+                 edit_interval=1.0):
+        self.bot = bot
+        self.edit_interval = edit_interval
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = OrderedDict()
+        # Monotonic time before which nothing is sent (after a 429)
+        self._paused_until = 0.0
+        self._sends = KeyedExecutor(max_workers=workers, max_pending=10000, name="tg-send")
+        self._background = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tg-bg")
+        self.sent = 0
+        self.edited = 0
+        self.throttled = 0
+        self.dropped = 0
+
+    # ---- public API ----
+
+    def send(self, chat_id, text, **kwargs):
+        """Send a message in order with the chat's other sends and return it."""
+        return self.send_later(chat_id, text, **kwargs).result()
+
+    def send_later(self, chat_id, text, **kwargs):
+        """Queue a message behind the chat's earlier sends; returns a Future."""
+        return self._sends.submit(chat_id, self._send_now, chat_id, text, kwargs)
+
+    def edit_later(self, chat_id, message_id, text, **kwargs):
+        """Queue an edit of a sent message's text behind the chat's sends; returns a Future."""
+        return self._sends.submit(chat_id, self._edit_now, chat_id, message_id, text, kwargs)
+
+    def live(self, chat_id, text, **kwargs) -> "LiveMessage":
+        """Send a message that will be edited in place as its text grows."""
+        message = self.send(chat_id, text, **kwargs)
+        return LiveMessage(self, chat_id, message.message_id, text, self.edit_interval)
+
+    def delete(self, chat_id, message_id) -> None:
+        """Delete a message in the background; failures are ignored."""
+        self._background.submit(self._quietly, self.bot.delete_message, chat_id, message_id)
+
+    def answer_callback(self, callback_query_id, **kwargs) -> None:
+        """Acknowledge a button tap in the background."""
+        self._background.submit(self._quietly, self.bot.answer_callback_query, callback_query_id, **kwargs)
+
+    # ---- internals ----
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            if len(self._chats) > MAX_CHAT_BUCKETS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    def _wait_for_slot(self, chat_id=None) -> None:
+        """
+        Block until the global bucket, and the chat's bucket when chat_id is
+        given, allow one more call.
+        """
+        while True:
+            with self._lock:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0:
+                    chat = self._chat_bucket(chat_id) if chat_id is not None else None
+                    wait = self._global.seconds_until_token()
+                    if chat is not None:
+                        wait = max(wait, chat.seconds_until_token())
+                    if wait <= 0:
+                        if chat is not None:
+                            chat.try_take()
+                        self._global.try_take()
+                        return
+                self.throttled += 1
+            time.sleep(wait)
+
+    def _pause(self, delay) -> None:
+        """Hold every call for delay seconds: Telegram's flood limit is per bot."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    def _send_now(self, chat_id, text, kwargs):
+        message = self._call(chat_id, self.bot.send_message, (chat_id, text), kwargs)
+        self.sent += 1
+        return message
+
+    def _edit_now(self, chat_id, message_id, text, kwargs):
+        try:
+            result = self._call(chat_id, self.bot.edit_message_text, (text, chat_id, message_id), kwargs)
+        except Exception as e:
+            if not_modified(e):
+                return None
+            raise
+        self.edited += 1
+        return result
+
+    def _call(self, chat_id, fn, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_slot(chat_id)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is None or attempt == self.max_retries:
+                    raise
+                print(f"Telegram 429 for chat {chat_id}, retrying in {delay:g}s")
+                self._pause(delay)
+
+    def _quietly(self, fn, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            # Not a message in any chat, but it counts against the bot's limit
+            self._wait_for_slot()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is None or attempt == self.max_retries:
+                    # e.g. message already deleted or too old to delete
+                    self.dropped += 1
+                    return None
+                self._pause(delay)
+
+    def stats(self) -> dict:
+        return dict(self._sends.stats(), sent=self.sent, edited=self.edited,
+                    throttled=self.throttled, dropped=self.dropped)
+
+    def close(self) -> None:
+        """Finish queued sends, edits and background calls."""
+        self._sends.shutdown(wait=True)
+        self._background.shutdown(wait=True)
+
+
+class LiveMessage:
+    """
+    A sent message whose text is replaced as it grows.
+
+    update() is cheap to call for every streamed chunk: it edits the message
+    only if edit_interval has passed and the previous edit is done, and
+    otherwise just remembers the latest text. finish() always shows the
+    final text.
+    """
+
+    def __init__(self, outbox, chat_id, message_id, text, edit_interval):
+        self.outbox = outbox
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.edit_interval = edit_interval
+        self.text = text
+        self._shown = text
+        self._pending = None
+        self._next_edit = time.monotonic() + edit_interval
+
+    def update(self, text) -> None:
+        """Show text if an edit is due now; otherwise keep it for the next one."""
+        self.text = text
+        if time.monotonic() < self._next_edit or (self._pending is not None and not self._pending.done()):
+            return
+        self._edit()
+
+    def finish(self, text=None, **kwargs):
+        """Show the final text (and e.g. reply_markup); returns the edit's Future or None."""
+        if text is not None:
+            self.text = text
+        return self._edit(**kwargs)
+
+    def _edit(self, **kwargs):
+        if not self.text.strip() or (self.text == self._shown and not kwargs):
+            return None
+        self._shown = self.text
+        self._next_edit = time.monotonic() + self.edit_interval
+        self._pending = self.outbox.edit_later(self.chat_id, self.message_id, self.text, **kwargs)
+        return self._pending
+
+
+def from_env(bot) -> TelegramOutbox:
+    """Build the bot's TelegramOutbox from environment variables."""
+    return TelegramOutbox(
+        bot,
+        global_rate=float(os.getenv("TG_GLOBAL_RATE", "25")),
+        chat_rate=float(os.getenv("TG_CHAT_RATE", "1")),
+        chat_burst=float(os.getenv("TG_CHAT_BURST", "5")),
+        workers=int(os.getenv("TG_SEND_WORKERS", "8")),
+        edit_interval=float(os.getenv("TG_EDIT_INTERVAL_S", "1")),
+    )
@@ -0,0 +1,122 @@
+"""
+Rule-based local triage compiled from symptoms_config.Json.
+
+Each flow step may carry a "severity" map from answer value to urgency
+category, and each symptom may list "severity_rules" that match several
+answers at once:
+
+    "severity": {"severe": "urgent"}
+    "severity_rules": [{"when": {"temp": "high", "duration": "long"}, "severity": "er"}]
+
+Categories are the facilities.json keys ("appointment", "urgent", "er",
+"trauma"); anything without a rule is self-care (""). The rules are compiled
+into dict lookups once, so a triage call is a handful of hash probes and can
+answer immediately while the LLM summary is still being generated, or stand
+in for it when the LLM is slow or down.
+"""
+
+
+# Ordered from least to most urgent; "" means self-care
+SEVERITY_ORDER = ["", "appointment", "urgent", "er", "trauma"]
+SEVERITY_RANK = {category: rank for rank, category in enumerate(SEVERITY_ORDER)}
+
+# Same wording the LLM is asked to use on its "Severity:" line
+SEVERITY_LABELS = {
+    "": "self-care",
+    "appointment": "Appointment with provider",
+    "urgent": "urgent care",
+    "er": "ER",
+    "trauma": "Trauma center",
+}
+
+
+def more_urgent(a: str, b: str) -> str:
+    """Return whichever of two urgency categories is more urgent."""
+    return a if SEVERITY_RANK.get(a, 0) >= SEVERITY_RANK.get(b, 0) else b
+
+
+class TriageResult:
+    __slots__ = ("category", "label", "reasons", "facilities")
+
+    def __init__(self, category, reasons, facilities):
+        self.category = category
+        self.label = SEVERITY_LABELS[category]
+        self.reasons = reasons
+        self.facilities = facilities
+
+    def to_text(self) -> str:
+        """Render a short summary in the same shape as the LLM triage reply."""
+        lines = [f"Severity: {self.label}"]
+        if self.reasons:
+            lines.append("Based on: " + "; ".join(self.reasons))
+        lines.append("This is an automatic check, not medical advice.")
+        return "\n".join(lines)
+
+
+class TriageEngine:
+    """Compiled severity rules plus facility lookup."""
+
+    def __init__(self, raw_config: dict, facility_data: dict = None):
+        self.facility_data = facility_data or {}
+        # (symptom, field_id, value) -> rank
+        self.answer_rules = {}
+        # symptom -> [(((field_id, value), ...), rank)], most urgent first
+        self.combo_rules = {}
+        self._compile(raw_config.get("symptoms", {}))
+
+    def _compile(self, symptoms: dict) -> None:
+        for name, cfg in symptoms.items():
+            for step in cfg.get("flow", []):
+                for value, category in step.get("severity", {}).items():
+                    self._check_category(category, name)
+                    self.answer_rules[(name, step["field_id"], value)] = SEVERITY_RANK[category]
+
+            rules = []
+            for rule in cfg.get("severity_rules", []):
+                self._check_category(rule["severity"], name)
+                rules.append((tuple(rule["when"].items()), SEVERITY_RANK[rule["severity"]]))
+            if rules:
+                rules.sort(key=lambda r: -r[1])
+                self.combo_rules[name] = rules
+
+    @staticmethod
+    def _check_category(category, symptom):
+        if category not in SEVERITY_RANK:
+            raise ValueError(f"Unknown severity '{category}' for symptom '{symptom}'")
+
+    def triage(self, symptoms, details) -> TriageResult:
+        """
+        Rate the selected symptoms and their follow-up answers.
+
+        Args:
+            symptoms: Iterable of selected symptom names
+            details: Dict of symptom -> {field_id: answer value}
+
+        Returns:
+            TriageResult with the most urgent matching category
+        """
+        best_rank = 0
+        reasons = []
+
+        for symptom in dict.fromkeys(list(symptoms) + list(details.keys())):
+            answers = details.get(symptom, {})
+
+            for field_id, value in answers.items():
+                rank = self.answer_rules.get((symptom, field_id, value), 0)
+                if rank > best_rank:
+                    best_rank, reasons = rank, []
+                if rank and rank == best_rank:
+                    reasons.append(f"{symptom} ({field_id}: {value})")
+
+            for conditions, rank in self.combo_rules.get(symptom, ()):
+                if rank < best_rank:
+                    break
+                if all(answers.get(f) == v for f, v in conditions):
+                    if rank > best_rank:
+                        best_rank, reasons = rank, []
+                    reasons.append(f"{symptom} ({', '.join(f'{f}: {v}' for f, v in conditions)})")
+                    break
+
+        category = SEVERITY_ORDER[best_rank]
+        return TriageResult(category, reasons, self.facility_data.get(category, []))
+
@@ -0,0 +1,124 @@
+"""
+Per-chat ordered, cross-chat parallel dispatch for Telegram updates.
+
+The bot's handlers block on the LLM for seconds at a time. Running every
+update on the polling thread made one user's wait everyone's wait. Updates
+are now handed to a bounded worker pool keyed by chat_id: updates from the
+same chat run one at a time in arrival order, so a chat's state machine
+never sees two of its updates at once, while different chats run in
+parallel.
+
+Settings (environment variables, all optional):
+    BOT_WORKERS      worker threads (default 16)
+    BOT_MAX_PENDING  queued updates before polling blocks (default 1000)
+"""
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import telebot
+
+
+class KeyedExecutor:
+    """Runs tasks serially per key and concurrently across keys."""
+
+    def __init__(self, max_workers=16, max_pending=1000, name="keyed"):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._name = name
+        self._lock = threading.Lock()
+        # key -> deque of tasks waiting behind the one that is running
+        self._queues = {}
+        # Backpressure: submit blocks once this many tasks are queued or running
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, key, fn, *args) -> Future:
+        """Queue fn(*args) behind any earlier task with the same key; the Future gets its result."""
+        future = Future()
+        self._slots.acquire()
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                # A task for this key is running; it will pick this one up
+                queue.append((fn, args, future))
+                return future
+            self._queues[key] = deque()
+        self._pool.submit(self._run, key, fn, args, future)
+        return future
+
+    def _run(self, key, fn, args, future):
+        while True:
+            try:
+                future.set_result(fn(*args))
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                future.set_exception(e)
+                print(f"Task failed for {self._name} key {key}: {e}")
+            finally:
+                self._slots.release()
+
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                fn, args, future = queue.popleft()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active_chats": len(self._queues),
+                "queued": sum(len(q) for q in self._queues.values()),
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+    def shutdown(self, wait=True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+def update_chat_id(update):
+    """Chat an update belongs to (None for update types without a chat)."""
+    for message in (update.message, update.edited_message, update.channel_post, update.edited_channel_post):
+        if message is not None:
+            return message.chat.id
+    callback = update.callback_query
+    if callback is not None:
+        if callback.message is not None:
+            return callback.message.chat.id
+        return callback.from_user.id
+    return None
+
+
+class OrderedTeleBot(telebot.TeleBot):
+    """
+    TeleBot that processes each chat's updates in order on a KeyedExecutor.
+
+    Create it with threaded=False: the executor replaces telebot's own
+    worker pool, which does not preserve per-chat order.
+    """
+
+    def __init__(self, token, executor, **kwargs):
+        kwargs.setdefault("threaded", False)
+        super().__init__(token, **kwargs)
+        self.executor = executor
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            # Advance the polling offset now; handlers may finish much later
+            if update.update_id > self.last_update_id:
+                self.last_update_id = update.update_id
+            self.executor.submit(update_chat_id(update), super().process_new_updates, [update])
+
+
+def from_env() -> KeyedExecutor:
+    """Build the update executor configured from environment variables."""
+    return KeyedExecutor(
+        max_workers=int(os.getenv("BOT_WORKERS", "16")),
+        max_pending=int(os.getenv("BOT_MAX_PENDING", "1000")),
+        name="bot-update",
+    )
@@ -5,8 +5,12 @@ Validates wallet addresses and message signatures.
 
 import hashlib
 import hmac
+import os
 from typing import Optional, Tuple
 
+# Header the Telegram bot sends with BOT_API_SECRET on its backend calls
+BOT_SECRET_HEADER = "X-Bot-Secret"
+
 
 def validate_wallet_address(address: str) -> bool:
     """
@@ -54,6 +58,26 @@ def verify_message_signature(message: str, signature: str, address: str) -> bool
     return validate_wallet_address(address) and len(signature) > 0
 
 
+def is_bot_request(request) -> bool:
+    """
+    Check that a request comes from the Telegram bot.
+
+    The bot cannot sign with the user's wallet, so it authenticates with the
+    shared BOT_API_SECRET instead. Always False while BOT_API_SECRET is unset.
+
+    Args:
+        request: Flask request object
+
+    Returns:
+        True if the request carries the bot secret
+    """
+    secret = os.getenv("BOT_API_SECRET", "")
+    if not secret:
+        return False
+    token = request.headers.get(BOT_SECRET_HEADER, "")
+    return hmac.compare_digest(token.encode("utf-8"), secret.encode("utf-8"))
+
+
 def get_wallet_from_request(request) -> Optional[str]:
     """
     Extract wallet address from request headers or body.
@@ -0,0 +1,145 @@
+"""
+Wound photo classifier shared by the web app (/predict) and the Telegram bot.
+
+A frozen MobileNetV2 backbone (ImageNet weights, average pooled) turns a
+224x224 image into a feature vector, and the scikit-learn head trained by
+train_model.py classifies it. Images are decoded from memory, nothing is
+written to disk. TensorFlow is imported by load(), so importing this module
+is cheap and the bot still starts where TensorFlow is not installed.
+
+Keras models should not be called from several threads at once, so
+predictions are serialized with a lock. Run predict() on a dedicated
+executor to keep it off request and update threads.
+"""
+
+import base64
+import io
+import os
+import pickle
+import threading
+
+import numpy as np
+from PIL import Image
+
+IMG_SIZE = (224, 224)  # Keep in sync with training script
+MODEL_FILENAME = 'wound_classifier.joblib'
+CLASS_NAMES_FILENAME = 'class_names.pkl'
+
+
+def decode_image(image_data) -> Image.Image:
+    """
+    Decode an image held in memory.
+
+    Args:
+        image_data: Raw bytes, a base64 string (optionally a data URL) or a PIL Image
+    """
+    if isinstance(image_data, Image.Image):
+        return image_data
+    if isinstance(image_data, str):
+        if image_data.startswith('data:image'):
+            # Remove data URL prefix
+            image_data = image_data.split(',')[1]
+        image_data = base64.b64decode(image_data)
+    return Image.open(io.BytesIO(image_data))
+
+
+def preprocess_image(img: Image.Image) -> np.ndarray:
+    """RGB, resized to IMG_SIZE, as a float32 batch of one."""
+    img = img.convert('RGB')
+    img = img.resize(IMG_SIZE)
+    img_array = np.array(img, dtype=np.float32)
+    return np.expand_dims(img_array, axis=0)
+
+
+class WoundClassifier:
+    """MobileNetV2 features + scikit-learn head, loaded once and reused."""
+
+    def __init__(self, model_path: str, class_names_path: str):
+        self.model_path = model_path
+        self.class_names_path = class_names_path
+        self.model = None
+        self.class_names = None
+        self.feature_extractor = None
+        self._preprocess_input = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dir(cls, base_dir: str) -> "WoundClassifier":
+        """Classifier for the model files train_model.py writes to base_dir."""
+        return cls(os.path.join(base_dir, MODEL_FILENAME), os.path.join(base_dir, CLASS_NAMES_FILENAME))
+
+    @property
+    def loaded(self) -> bool:
+        return self.model is not None and self.feature_extractor is not None
+
+    def load(self) -> bool:
+        """Load the trained scikit-learn classifier and MobileNet backbone."""
+        if not (os.path.exists(self.model_path) and os.path.exists(self.class_names_path)):
+            print("Model files not found. Please train the classifier first.")
+            return False
+
+        try:
+            from joblib import load as joblib_load
+            from tensorflow.keras.applications import MobileNetV2
+            from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+
+            print(f"Loading classifier from {self.model_path}...")
+            model = joblib_load(self.model_path)
+
+            with open(self.class_names_path, 'rb') as f:
+                class_names = pickle.load(f)
+
+            feature_extractor = MobileNetV2(
+                input_shape=(*IMG_SIZE, 3),
+                include_top=False,
+                pooling='avg',
+                weights='imagenet'
+            )
+            feature_extractor.trainable = False
+
+            self.model, self.class_names = model, class_names
+            self.feature_extractor, self._preprocess_input = feature_extractor, preprocess_input
+            print(f"Classifier loaded. Classes: {class_names}")
+            return True
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            self.model = None
+            self.feature_extractor = None
+            return False
+
+    def predict(self, image_data) -> dict:
+        """
+        Classify one wound photo.
+
+        Args:
+            image_data: Raw bytes, a base64 string or a PIL Image
+
+        Returns:
+            dict: predicted_class, confidence and top_3 [{class, confidence}]
+
+        Raises:
+            RuntimeError: If the model is not loaded
+        """
+        if not self.loaded:
+            raise RuntimeError("Model not loaded. Please train the model first.")
+
+        img_array = self._preprocess_input(preprocess_image(decode_image(image_data)))
+
+        with self._lock:
+            # Direct call instead of predict(): no per-call batching overhead
+            features = self.feature_extractor(img_array, training=False).numpy()
+            predictions = self.model.predict_proba(features)[0]
+
+        predicted_class_idx = int(np.argmax(predictions))
+        top_3_indices = np.argsort(predictions)[-3:][::-1]
+        return {
+            'predicted_class': self.class_names[predicted_class_idx],
+            'confidence': float(predictions[predicted_class_idx]),
+            'top_3': [
+                {
+                    'class': self.class_names[idx],
+                    'confidence': float(predictions[idx])
+                }
+                for idx in top_3_indices
+            ]
+        }
@@ -41,15 +41,32 @@ const Chat = () => {
     // Try loading from backend if wallet is connected
     if (isConnected && walletAddress) {
       try {
-        const response = await fetch(`${API_CONFIG.BACKEND_URL}/chat/conversation/${id}?wallet_address=${walletAddress}`, {
-          headers: {
-            'Authorization': `Wallet ${walletAddress}`,
-          },
-        });
-        
-        if (response.ok) {
+        // Pages come newest first, each in chronological order: follow
+        // next_cursor and prepend older pages until the first message
+        let pages: any[] = [];
+        let cursor: string | null = null;
+        let complete = false;
+        while (true) {
+          const params = new URLSearchParams({ wallet_address: walletAddress, limit: "200" });
+          if (cursor) params.set("before", cursor);
+          const response = await fetch(`${API_CONFIG.BACKEND_URL}/chat/conversation/${id}?${params}`, {
+            headers: {
+              'Authorization': `Wallet ${walletAddress}`,
+            },
+          });
+          if (!response.ok) break;
+
           const data = await response.json();
-          const loadedMessages = data.messages.map((m: any) => ({ 
+          pages = [...(data.messages || []), ...pages];
+          cursor = data.next_cursor;
+          if (!cursor) {
+            complete = true;
+            break;
+          }
+        }
+
+        if (complete) {
+          const loadedMessages = pages.map((m: any) => ({ 
             role: m.role as "user" | "assistant", 
             content: m.content 
           }));
@@ -123,7 +140,8 @@ const Chat = () => {
     // Also save to backend if wallet is connected
     if (isConnected && walletAddress) {
       try {
-        await fetch(`${API_CONFIG.BACKEND_URL}/chat`, {
+        // Persist only; /chat is reserved for generating replies
+        await fetch(`${API_CONFIG.BACKEND_URL}/chat/messages`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
@@ -25,6 +25,8 @@ type Conversation = {
   id: string;
   title: string;
   updated_at: string;
+  message_count?: number;
+  last_message_preview?: string | null;
 };
 
 const History = () => {
@@ -42,15 +44,31 @@ const History = () => {
     // Load from backend if wallet is connected
     if (isConnected && walletAddress) {
       try {
-        const response = await fetch(`${API_CONFIG.BACKEND_URL}/chat/history?wallet_address=${walletAddress}`, {
-          headers: {
-            'Authorization': `Wallet ${walletAddress}`,
-          },
-        });
-        
-        if (response.ok) {
+        // The endpoint is paginated: follow next_cursor until the last page
+        const loaded: Conversation[] = [];
+        let cursor: string | null = null;
+        let complete = false;
+        while (true) {
+          const params = new URLSearchParams({ wallet_address: walletAddress, limit: "200" });
+          if (cursor) params.set("before", cursor);
+          const response = await fetch(`${API_CONFIG.BACKEND_URL}/chat/history?${params}`, {
+            headers: {
+              'Authorization': `Wallet ${walletAddress}`,
+            },
+          });
+          if (!response.ok) break;
+
           const data = await response.json();
-          setConversations(data.conversations || []);
+          loaded.push(...(data.conversations || []));
+          cursor = data.next_cursor;
+          if (!cursor) {
+            complete = true;
+            break;
+          }
+        }
+
+        if (complete) {
+          setConversations(loaded);
           return;
         }
       } catch (error) {
@@ -141,8 +159,14 @@ const History = () => {
                       <MessageSquare className="h-5 w-5 text-primary" />
                       <div className="flex-1">
                         <p className="font-medium text-foreground">{conv.title}</p>
+                        {conv.last_message_preview && (
+                          <p className="text-sm text-muted-foreground line-clamp-1">
+                            {conv.last_message_preview}
+                          </p>
+                        )}
                         <p className="text-sm text-muted-foreground">
                           {format(new Date(conv.updated_at), "PPp")}
+                          {conv.message_count !== undefined && ` · ${conv.message_count} messages`}
                         </p>
                       </div>
                     </div>